@@ -12,7 +12,11 @@ from slot import manage_slots  # 确保这行导入存在
 from intent import manage_intents
 from corpus import manage_corpus  # 导入 manage_corpus 函数
 from corpus_gen import manage_corpus_gen  # 导入新的函数
+from gen_metrics import render_sidebar as render_metrics_sidebar
 import hashlib
+from db import get_connection, database_path
+from cascade import CleanupJob, describe_cleanup
+import catalog
 
 # 设置页面配置
 st.set_page_config(layout="wide", page_title="语料管理系统")
@@ -49,65 +53,11 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 数库连接
-conn = sqlite3.connect('cms_data_test.db')
+# 数库连接,每个会话一个连接;数据库结构在进程内第一次连接时自动迁移到最新版本
+conn = get_connection()
 c = conn.cursor()
 
 
-# 创建必要的表
-c.execute('''CREATE TABLE IF NOT EXISTS products
-             (product_id INTEGER PRIMARY KEY, 
-              name TEXT, 
-              description TEXT, 
-              created_at DATETIME)''')
-
-c.execute('''CREATE TABLE IF NOT EXISTS features
-             (feature_id INTEGER PRIMARY KEY,
-              product_id INTEGER,
-              name TEXT,
-              name_en TEXT,
-              description TEXT,
-              created_at DATETIME,
-              is_active BOOLEAN DEFAULT 1,
-              FOREIGN KEY(product_id) REFERENCES products(product_id))''')
-
-
-c.execute('''CREATE TABLE IF NOT EXISTS slots
-             (slot_id INTEGER PRIMARY KEY,
-              product_id INTEGER,
-              name TEXT,
-              description TEXT,
-              examples TEXT,
-              is_active BOOLEAN DEFAULT 1,
-              FOREIGN KEY(product_id) REFERENCES products(product_id))''')
-
-c.execute('''CREATE TABLE IF NOT EXISTS intents
-             (intent_id INTEGER PRIMARY KEY,
-              product_id INTEGER NOT NULL,
-              feature_id INTEGER NOT NULL,
-              slot_id INTEGER,
-              intent_ch TEXT,
-              intent_en TEXT,
-              description TEXT,
-              created_at DATETIME,
-              is_active BOOLEAN DEFAULT 1,
-              FOREIGN KEY(product_id) REFERENCES products(product_id),
-              FOREIGN KEY(feature_id) REFERENCES features(feature_id),
-              FOREIGN KEY(slot_id) REFERENCES slots(slot_id))''')
-
-c.execute('''CREATE TABLE IF NOT EXISTS corpus
-             (corpus_id INTEGER PRIMARY KEY,
-              intent_id INTEGER NOT NULL,
-              slot_id INTEGER,
-              intent_en TEXT,
-              score FLOAT,
-              is_active BOOLEAN DEFAULT 0,
-              FOREIGN KEY(intent_id) REFERENCES intents(intent_id),
-              FOREIGN KEY(slot_id) REFERENCES slots(slot_id))''')
-
-conn.commit()
-
-
 
 
 # 添加用户认证相关函数
@@ -158,6 +108,7 @@ def main():
             navigation = st.sidebar.radio("选择页面", ["产品列表", "功能管理", "Slots管理", "意图管理", "语料管理", "语料生成"])
             if st.sidebar.button("退出登录"):
                 logout()
+            render_metrics_sidebar(conn)
 
         with col2:
             if 'selected_product_id' not in st.session_state:
@@ -168,8 +119,7 @@ def main():
             elif navigation == "功能管理":
                 if 'selected_product_id' not in st.session_state or st.session_state.selected_product_id is None:
                     st.warning("请先选择一个产品")
-                    c.execute("SELECT product_id, name FROM products")
-                    products = c.fetchall()
+                    products = catalog.products(conn)
                     product_options = {p[1]: p[0] for p in products}
                     selected_product = st.selectbox("选择产品", list(product_options.keys()))
                     if selected_product:
@@ -232,6 +182,32 @@ def manage_products():
     else:
         st.info("目前没有添加任何产品。")
 
+    # 数据维护:清理孤立数据并回收空间,在后台线程执行
+    st.markdown("---")
+    st.subheader("数据维护")
+    job = st.session_state.get('cleanup_job')
+    running = job is not None and not job.done
+    if st.button("清理孤立数据并回收空间", disabled=running,
+                 help="删除上级已不存在的功能、意图、语料和生成任务，然后压缩数据库文件"):
+        st.session_state.cleanup_job = CleanupJob(database_path(conn))
+        st.session_state.cleanup_job.start()
+        st.rerun()
+    if running:
+        _cleanup_progress(job)
+    elif job is not None:
+        if job.error:
+            st.error(f"清理失败: {job.error}")
+        else:
+            st.success(describe_cleanup(job.result))
+
+
+# 后台清理时每秒刷新一次状态,完成后整页重跑以显示结果
+@st.fragment(run_every=1)
+def _cleanup_progress(job):
+    if job.done:
+        st.rerun()
+    st.info(f"正在清理：{job.stage}...")
+
 # 在 main 函数中添加：
 if 'view_product' not in st.session_state:
     st.session_state.view_product = False
@@ -0,0 +1,67 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from corpus_store import bulk_insert_corpus, delete_corpus, set_corpus_active
+from db import connect
+from migrations import migrate
+
+# 对比逐行 UPDATE/DELETE 和 set_corpus_active / delete_corpus 处理一批选中语料的耗时
+# 用法: python bench_bulk.py --rows 500000 --selected 10000
+
+
+def setup_db(path, rows):
+    conn = connect(path)
+    migrate(conn)
+    conn.execute("INSERT INTO products (name) VALUES ('bench')")
+    conn.execute("INSERT INTO features (product_id, name) VALUES (1, 'bench')")
+    conn.executemany("INSERT INTO intents (product_id, feature_id, intent_ch) VALUES (1, 1, ?)",
+                     [(f"intent {i}",) for i in range(100)])
+    conn.commit()
+    bulk_insert_corpus(conn, ((i % 100 + 1, None, f"please start cleaning the room number {i}", 0.9, 1)
+                              for i in range(rows)))
+    return conn
+
+
+def per_row_update(conn, ids):
+    # 逐条修改的写法,每条一个语句,最后统一提交
+    c = conn.cursor()
+    for corpus_id in ids:
+        c.execute("UPDATE corpus SET is_active = 0 WHERE corpus_id = ?", (corpus_id,))
+    conn.commit()
+
+
+def per_row_delete(conn, ids):
+    c = conn.cursor()
+    for corpus_id in ids:
+        c.execute("DELETE FROM corpus WHERE corpus_id = ?", (corpus_id,))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--selected", type=int, default=10000)
+    args = parser.parse_args()
+    ids = random.Random(0).sample(range(1, args.rows + 1), args.selected)
+
+    cases = [
+        ("update/per-row", per_row_update),
+        ("update/bulk", lambda conn, ids: set_corpus_active(conn, False, corpus_ids=ids)),
+        ("delete/per-row", per_row_delete),
+        ("delete/bulk", lambda conn, ids: delete_corpus(conn, corpus_ids=ids)),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in cases:
+            conn = setup_db(os.path.join(tmp, f"{name.replace('/', '_')}.db"), args.rows)
+            start = time.perf_counter()
+            fn(conn, ids)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<16} {elapsed * 1000:8.1f} ms")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
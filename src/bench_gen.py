@@ -0,0 +1,95 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+# 使用离线后端测量生成链路的吞吐,不需要网络,结果可复现
+# 用法: python bench_gen.py --intents 50 --latency 0.2 --failure-rate 0.05
+
+import igen
+import corpus_gen
+import gen_scheduler
+from gen_cache import ResponseCache
+from migrations import migrate
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+
+def setup_db(path, intents):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    c = conn.cursor()
+    c.execute("INSERT INTO products (name, description, created_at) VALUES ('扫地机器人', '', '2024-01-01 00:00:00')")
+    product_id = c.lastrowid
+    c.execute("INSERT INTO features (product_id, name, name_en, description, created_at) VALUES (?, '清扫', 'clean', '', '2024-01-01 00:00:00')",
+              (product_id,))
+    feature_id = c.lastrowid
+    c.executemany("INSERT INTO intents (product_id, feature_id, intent_ch, intent_en, description, created_at) VALUES (?, ?, ?, ?, '', '2024-01-01 00:00:00')",
+                  [(product_id, feature_id, f"start cleaning room {i}", f"clean_room_{i}") for i in range(intents)])
+    conn.commit()
+    return conn, product_id
+
+
+def report(name, seconds, items, unit):
+    print(f"{name:<32} {seconds:8.3f} s  {items / seconds:10.1f} {unit}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--intents", type=int, default=50)
+    parser.add_argument("--n", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--insert-rows", type=int, default=10000)
+    parser.add_argument("--rpm", type=int, default=6000)
+    parser.add_argument("--retry-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    igen.set_backend(igen.OfflineBackend(latency=args.latency, failure_rate=args.failure_rate, seed=42))
+    gen_scheduler.default_scheduler = gen_scheduler.Scheduler(rpm=args.rpm, tpm=args.rpm * 1000,
+                                                              base_delay=args.retry_delay)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn, product_id = setup_db(os.path.join(tmp, "bench.db"), args.intents)
+        # 使用临时缓存文件,不影响正式的响应缓存
+        igen.response_cache = ResponseCache(path=os.path.join(tmp, "cache.db"))
+        intents = conn.execute("SELECT intent_id, intent_ch FROM intents").fetchall()
+
+        # 单意图生成(不走缓存)
+        start = time.perf_counter()
+        phrases = 0
+        failures = 0
+        for intent_id, intent_name in intents[:10]:
+            try:
+                phrases += len(corpus_gen.generate_corpus(intent_id, "扫地机器人", intent_name, "", "", "",
+                                                          "常规(Normal)", [], args.n, use_cache=False))
+            except igen.BackendError:
+                failures += 1
+        report(f"generate_corpus (10 intents, {failures} failed)", time.perf_counter() - start, phrases, "phrases")
+
+        # 批量生成,不同并发数;关闭去重以免结果受已插入语料影响
+        for workers in args.workers:
+            conn.execute("DELETE FROM corpus")
+            conn.commit()
+            igen.response_cache.clear()
+            start = time.perf_counter()
+            corpus_gen.batch_generate_corpus(conn, product_id, "常规(Normal)", args.n, max_workers=workers, dedup_threshold=None)
+            elapsed = time.perf_counter() - start
+            failed = conn.execute("SELECT COUNT(*) FROM generation_tasks WHERE status = 'failed' AND job_id = (SELECT MAX(job_id) FROM generation_jobs)").fetchone()[0]
+            report(f"batch_generate_corpus (x{workers}, {failed} failed)", elapsed, len(intents), "intents")
+
+        # 写入路径
+        rows = [[intents[i % len(intents)][0], None, f"phrase {i}", 0.9] for i in range(args.insert_rows)]
+        task_id = conn.execute("SELECT MAX(task_id) FROM generation_tasks").fetchone()[0]
+        start = time.perf_counter()
+        for i in range(0, len(rows), args.n):
+            corpus_gen.gen_jobs.complete_task(conn, task_id, rows[i:i + args.n])
+        report(f"insert ({args.insert_rows} rows)", time.perf_counter() - start, args.insert_rows, "rows")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
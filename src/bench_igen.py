@@ -0,0 +1,55 @@
+import os
+import time
+
+# 只测量对象构建开销,不会真正请求 OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from langchain.prompts import FewShotPromptTemplate, PromptTemplate
+from langchain_experimental.tabular_synthetic_data.openai import (
+    create_openai_data_generator,
+)
+from langchain_openai import ChatOpenAI
+
+import igen
+
+ITERATIONS = 200
+VARIABLES = dict(subject="扫地机器人", operation="开始扫地", style="Normal",
+                 examples=str(["Start cleaning.", "Begin cleaning."]), slots="", n=10, extra="")
+
+
+def legacy_setup():
+    # 优化前 igen.generate 每次调用都会做的事情
+    few_shot_prompt_template = FewShotPromptTemplate(
+        prefix=igen.PROMPT_PREFIX,
+        examples=[{"example": f"phrases: {VARIABLES['examples']}"}],
+        suffix=igen.PROMPT_SUFFIX,
+        input_variables=["subject", "operation", "style", "slots", "n", "extra"],
+        example_prompt=PromptTemplate(input_variables=["example"], template="{example}"),
+    )
+    generator = create_openai_data_generator(
+        output_schema=igen.Instruction,
+        llm=ChatOpenAI(model=igen.DEFAULT_MODEL, temperature=1),
+        prompt=few_shot_prompt_template
+    )
+    return generator.llm_chain.prep_prompts([VARIABLES])
+
+
+def cached_setup():
+    chain = igen.get_chain(igen.DEFAULT_MODEL)
+    return chain.prep_prompts([VARIABLES])
+
+
+def bench(name, fn):
+    fn()  # 预热
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    per_call = (time.perf_counter() - start) / ITERATIONS * 1000
+    print(f"{name:<8} {per_call:8.3f} ms/call")
+    return per_call
+
+
+if __name__ == "__main__":
+    before = bench("before", legacy_setup)
+    after = bench("after", cached_setup)
+    print(f"speedup  {before / after:8.1f}x")
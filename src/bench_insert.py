@@ -0,0 +1,72 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from corpus_store import bulk_insert_corpus
+from migrations import migrate
+
+# 对比逐行 INSERT 和 bulk_insert_corpus 的写入速度
+# 用法: python bench_insert.py --rows 100000
+
+
+def setup_db(path):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("INSERT INTO products (name) VALUES ('bench')")
+    conn.execute("INSERT INTO features (product_id, name) VALUES (1, 'bench')")
+    conn.executemany("INSERT INTO intents (product_id, feature_id, intent_ch) VALUES (1, 1, ?)",
+                     [(f"intent {i}",) for i in range(100)])
+    conn.commit()
+    return conn
+
+
+def make_rows(n):
+    return [(i % 100 + 1, None, f"please start cleaning the room number {i}", 0.9, 1) for i in range(n)]
+
+
+def legacy_insert(conn, rows, with_ui=False):
+    # 优化前 import_corpus / batch_generate_corpus 的写法
+    # with_ui=True 时同时计入逐行 st.write 的服务端序列化开销(不含浏览器渲染)
+    if with_ui:
+        import streamlit as st
+        logging.getLogger("streamlit").setLevel(logging.ERROR)
+    c = conn.cursor()
+    for row in rows:
+        query = """
+            INSERT INTO corpus (intent_id, slot_id, intent_en, score, is_active)
+            VALUES (?, ?, ?, ?, 1)
+        """
+        if with_ui:
+            st.write(f"SQL 查询语句: {query}")
+            st.write(f"插入的数据: {row[:4]}")
+        c.execute(query, row[:4])
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+    rows = make_rows(args.rows)
+
+    cases = [
+        ("legacy+ui", lambda conn, rows: legacy_insert(conn, rows, with_ui=True)),
+        ("legacy", legacy_insert),
+        ("bulk", bulk_insert_corpus),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in cases:
+            conn = setup_db(os.path.join(tmp, f"{name}.db"))
+            start = time.perf_counter()
+            fn(conn, rows)
+            elapsed = time.perf_counter() - start
+            count = conn.execute("SELECT COUNT(*) FROM corpus").fetchone()[0]
+            print(f"{name:<10} {elapsed:8.3f} s  {count / elapsed:12.0f} rows/s")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+# 冷启动基准:页面模块的导入耗时(python -X importtime)和首页首次渲染耗时。
+# 每一项都在新的子进程中测量,用法: python bench_startup.py
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGE_MODULES = ["feature", "slot", "intent", "corpus", "corpus_gen", "gen_metrics", "db"]
+
+RENDER_SCRIPT = """
+import time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+start = time.perf_counter()
+at.run()
+print(time.perf_counter() - start)
+"""
+
+
+def import_time():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + ", ".join(PAGE_MODULES)],
+                            cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    top_level = []
+    loaded = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        loaded.append(name.strip())
+        # 没有缩进的是顶层导入
+        if not name[1:].startswith(" "):
+            top_level.append((int(cumulative), name.strip()))
+    total = sum(us for us, _ in top_level)
+    langchain = any(name.startswith("langchain") for name in loaded)
+    return total / 1e6, sorted(top_level, reverse=True)[:5], langchain
+
+
+def first_render():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=SRC_DIR)
+        result = subprocess.run([sys.executable, "-c", RENDER_SCRIPT.format(app=os.path.join(SRC_DIR, "app.py"))],
+                                cwd=tmp, env=env, capture_output=True, text=True, check=True)
+        return float(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    total, heaviest, langchain = import_time()
+    print(f"页面模块导入  {total:8.3f} s  (LangChain 已加载: {'是' if langchain else '否'})")
+    for us, name in heaviest:
+        print(f"    {name:<24} {us / 1e6:8.3f} s")
+    print(f"首页首次渲染  {first_render():8.3f} s")
@@ -0,0 +1,186 @@
+import threading
+
+from db import connect
+
+# 功能/意图/Slot 的级联删除。数据库没有开启 PRAGMA foreign_keys,直接按名称 DELETE 会把
+# 下属的意图、语料和生成任务留在表里,所以页面上的删除统一走这里:
+# 要删除的 ID 先写入临时表,再按 功能 -> 意图 -> 语料 的顺序各用一条
+# DELETE ... WHERE ... IN (SELECT id FROM 临时表) 在同一个事务中删除,一次可以删除任意多个。
+# Slot 是意图的可选关联,删除 Slot 时意图和语料保留,只把关联置空(和导入时 Slot 不存在的处理一致)
+
+
+def _stage_ids(c, table, ids):
+    c.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY)")
+    c.execute(f"DELETE FROM temp.{table}")
+    c.executemany(f"INSERT OR IGNORE INTO temp.{table} (id) VALUES (?)", ((int(i),) for i in ids))
+
+
+def _delete_staged_intents(c, result):
+    # 删除 temp.cascade_intents 中的意图及其语料、生成任务
+    c.execute("DELETE FROM corpus WHERE intent_id IN (SELECT id FROM temp.cascade_intents)")
+    result["corpus"] = c.rowcount
+    c.execute("DELETE FROM generation_tasks WHERE intent_id IN (SELECT id FROM temp.cascade_intents)")
+    result["tasks"] = c.rowcount
+    c.execute("DELETE FROM intents WHERE intent_id IN (SELECT id FROM temp.cascade_intents)")
+    result["intents"] = c.rowcount
+
+
+def _run(conn, work):
+    # 在一个写事务中执行 work(cursor, result),返回各表删除的行数
+    result = {"features": 0, "slots": 0, "intents": 0, "corpus": 0, "tasks": 0}
+    c = conn.cursor()
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        c.execute("BEGIN IMMEDIATE")
+    try:
+        work(c, result)
+        if own_transaction:
+            conn.commit()
+    except Exception:
+        # 调用方的事务由调用方决定是否回滚
+        if own_transaction:
+            conn.rollback()
+        raise
+    return result
+
+
+def delete_features(conn, product_id, feature_ids):
+    # 删除产品下的若干功能,连同它们的意图、语料和生成任务
+    def work(c, result):
+        _stage_ids(c, "cascade_features", feature_ids)
+        _stage_ids(c, "cascade_intents", [])
+        c.execute("""INSERT INTO temp.cascade_intents (id)
+                     SELECT intent_id FROM intents
+                     WHERE product_id = ? AND feature_id IN (SELECT id FROM temp.cascade_features)""", (product_id,))
+        _delete_staged_intents(c, result)
+        c.execute("""DELETE FROM features
+                     WHERE product_id = ? AND feature_id IN (SELECT id FROM temp.cascade_features)""", (product_id,))
+        result["features"] = c.rowcount
+    return _run(conn, work)
+
+
+def delete_intents(conn, product_id, intent_ids):
+    # 删除产品下的若干意图,连同它们的语料和生成任务
+    def work(c, result):
+        _stage_ids(c, "cascade_selected", intent_ids)
+        _stage_ids(c, "cascade_intents", [])
+        c.execute("""INSERT INTO temp.cascade_intents (id)
+                     SELECT intent_id FROM intents
+                     WHERE product_id = ? AND intent_id IN (SELECT id FROM temp.cascade_selected)""", (product_id,))
+        _delete_staged_intents(c, result)
+    return _run(conn, work)
+
+
+def delete_slots(conn, product_id, slot_ids):
+    # 删除产品下的若干 Slot,引用它们的意图改为不关联 Slot。
+    # corpus.slot_id 页面不会写入,残留的引用由 cleanup_orphans 清理,这里不扫描语料表
+    def work(c, result):
+        _stage_ids(c, "cascade_slots", slot_ids)
+        c.execute("""UPDATE intents SET slot_id = NULL
+                     WHERE product_id = ? AND slot_id IN (SELECT id FROM temp.cascade_slots)""", (product_id,))
+        c.execute("""DELETE FROM slots
+                     WHERE product_id = ? AND slot_id IN (SELECT id FROM temp.cascade_slots)""", (product_id,))
+        result["slots"] = c.rowcount
+    return _run(conn, work)
+
+
+def describe_delete(result):
+    # 给页面显示的删除结果,只列出有删除的表
+    labels = [("features", "功能"), ("slots", "Slot"), ("intents", "意图"), ("corpus", "语料"), ("tasks", "生成任务")]
+    parts = [f"{label} {result[key]} 条" for key, label in labels if result[key]]
+    return "删除了 " + "，".join(parts) if parts else "没有删除任何记录"
+
+
+# 孤立数据:引用的上级记录已不存在的行。按上级到下级的顺序删除,前面删掉的行会让后面的行成为孤立数据
+ORPHAN_DELETES = [
+    ("features", "DELETE FROM features WHERE product_id NOT IN (SELECT product_id FROM products)"),
+    ("slots", "DELETE FROM slots WHERE product_id NOT IN (SELECT product_id FROM products)"),
+    ("intents", """DELETE FROM intents WHERE product_id NOT IN (SELECT product_id FROM products)
+                   OR feature_id NOT IN (SELECT feature_id FROM features)"""),
+    ("corpus", "DELETE FROM corpus WHERE intent_id NOT IN (SELECT intent_id FROM intents)"),
+    ("tasks", "DELETE FROM generation_tasks WHERE intent_id NOT IN (SELECT intent_id FROM intents)"),
+]
+
+# 指向不存在的 Slot 的可选关联置空
+ORPHAN_SLOT_REFERENCES = [
+    "UPDATE intents SET slot_id = NULL WHERE slot_id IS NOT NULL AND slot_id NOT IN (SELECT slot_id FROM slots)",
+    "UPDATE corpus SET slot_id = NULL WHERE slot_id IS NOT NULL AND slot_id NOT IN (SELECT slot_id FROM slots)",
+]
+
+
+def database_size(conn):
+    # 数据库文件的字节数(含空闲页)
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_size * conn.execute("PRAGMA page_count").fetchone()[0]
+
+
+def cleanup_orphans(conn, vacuum=True, on_stage=None):
+    # 删除孤立数据,合并全文索引,再 VACUUM 回收空闲页。返回 dict:
+    # 各表删除的行数、slot_refs(置空的 Slot 引用数)、size_before / size_after(数据库文件字节数)
+    # on_stage: 每开始一个阶段调用一次,参数为阶段说明
+    def stage(text):
+        if on_stage is not None:
+            on_stage(text)
+
+    result = {"features": 0, "slots": 0, "intents": 0, "corpus": 0, "tasks": 0, "slot_refs": 0}
+    result["size_before"] = database_size(conn)
+    c = conn.cursor()
+    stage("删除孤立数据")
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        for key, sql in ORPHAN_DELETES:
+            c.execute(sql)
+            result[key] = c.rowcount
+        for sql in ORPHAN_SLOT_REFERENCES:
+            c.execute(sql)
+            result["slot_refs"] += c.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    stage("合并全文索引")
+    c.execute("INSERT INTO corpus_fts (corpus_fts) VALUES ('optimize')")
+    conn.commit()
+    if vacuum:
+        # VACUUM 重写整个文件;WAL 模式下写入先落在 -wal 文件中,checkpoint 后主文件才变小
+        stage("回收空间")
+        c.execute("VACUUM")
+        c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    result["size_after"] = database_size(conn)
+    return result
+
+
+def describe_cleanup(result):
+    deleted = describe_delete(result)
+    if result["slot_refs"]:
+        deleted += f"；清除了 {result['slot_refs']} 个失效的 Slot 关联"
+    reclaimed = result["size_before"] - result["size_after"]
+    return (f"{deleted}；数据库从 {result['size_before'] / 1048576:.1f} MB 变为 "
+            f"{result['size_after'] / 1048576:.1f} MB，回收 {reclaimed / 1048576:.1f} MB")
+
+
+class CleanupJob:
+    # 后台执行 cleanup_orphans,VACUUM 在大库上要几十秒,不阻塞页面。
+    # 使用自己的连接,页面通过 stage / done / result / error 查看进度
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.stage = "等待开始"
+        self.done = False
+        self.result = None
+        self.error = None
+
+    def run(self):
+        conn = connect(self.db_path)
+        try:
+            self.result = cleanup_orphans(conn, on_stage=self._stage)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            conn.close()
+            self.done = True
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def _stage(self, text):
+        self.stage = text
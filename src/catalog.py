@@ -0,0 +1,65 @@
+import threading
+
+from db import connect, database_path
+
+# 下拉框用到的产品/功能/意图/槽位列表在进程内共享缓存,所有会话共用。
+# 每个数据库文件有一个只读的监视连接,通过 PRAGMA data_version 判断缓存是否过期:
+# 其他任何连接(包括其他会话、后台线程、其他进程)提交写入后该值都会变化,
+# 检查一次只是一条 PRAGMA,不读任何表
+_lock = threading.Lock()
+_watchers = {}  # 数据库路径 -> 监视连接
+_entries = {}   # 数据库路径 -> (data_version, {查询键: 结果})
+
+
+def _db_path(conn):
+    path = database_path(conn)
+    return path if path != ":memory:" else ""
+
+
+def _current(path):
+    # 返回该数据库当前版本下的缓存字典,版本变化时整体丢弃。调用方需持有 _lock
+    watcher = _watchers.get(path)
+    if watcher is None:
+        watcher = _watchers[path] = connect(path)
+    version = watcher.execute("PRAGMA data_version").fetchone()[0]
+    entry = _entries.get(path)
+    if entry is None or entry[0] != version:
+        entry = _entries[path] = (version, {})
+    return entry[1]
+
+
+def _cached(conn, sql, args=()):
+    path = _db_path(conn)
+    # 内存数据库无法被其他连接观察;连接上有未提交的写入时结果对其他会话不可见,都不走缓存
+    if not path or conn.in_transaction:
+        return conn.execute(sql, args).fetchall()
+    key = (sql, args)
+    with _lock:
+        bucket = _current(path)
+        rows = bucket.get(key)
+    if rows is None:
+        # 结果放回查询前取到的那个版本的字典:查询期间若有写入,下次检查时版本变化会整体丢弃它
+        rows = conn.execute(sql, args).fetchall()
+        with _lock:
+            bucket[key] = rows
+    return list(rows)
+
+
+def products(conn):
+    return _cached(conn, "SELECT product_id, name FROM products")
+
+
+def features(conn, product_id):
+    return _cached(conn, "SELECT feature_id, name FROM features WHERE product_id = ?", (product_id,))
+
+
+def intents(conn, product_id, feature_id=None):
+    if feature_id is None:
+        return _cached(conn, "SELECT intent_id, intent_ch FROM intents WHERE product_id = ?", (product_id,))
+    return _cached(conn, "SELECT intent_id, intent_ch FROM intents WHERE product_id = ? AND feature_id = ?",
+                   (product_id, feature_id))
+
+
+def slots(conn, product_id):
+    return _cached(conn, "SELECT slot_id, name FROM slots WHERE product_id = ?", (product_id,))
+
@@ -0,0 +1,109 @@
+# 功能和 Slot 的 CSV 批量导入:按 (product_id, name) 唯一约束做 upsert,
+# 已存在的同名记录更新内容,重复上传同一个文件不会产生重复数据。
+# 另有功能/意图/Slot 的批量激活和停用
+
+from datetime import datetime
+
+UPSERT_FEATURE_SQL = """
+    INSERT INTO features (product_id, name, name_en, description, created_at, is_active)
+    VALUES (?, ?, ?, ?, ?, 1)
+    ON CONFLICT (product_id, name) DO UPDATE SET
+        name_en = excluded.name_en,
+        description = excluded.description
+"""
+
+UPSERT_SLOT_SQL = """
+    INSERT INTO slots (product_id, name, description, examples, is_active)
+    VALUES (?, ?, ?, ?, 1)
+    ON CONFLICT (product_id, name) DO UPDATE SET
+        description = excluded.description,
+        examples = excluded.examples
+"""
+
+
+def _prepare(df, columns):
+    # 取出 name 和要写入的列,空值转成 None,其余转成字符串(这些列都是 TEXT)。
+    # 返回 (按名称去重后的行, 文件内重复的行数, 名称为空的行数);同名的行以最后一行为准
+    df = df[["name"] + columns].astype(object)
+    df = df.where(df.isna(), df.astype(str)).where(df.notna(), None)
+    df["name"] = df["name"].str.strip()
+    empty = df["name"].isna() | (df["name"] == "")
+    df = df[~empty]
+    deduped = df.drop_duplicates("name", keep="last")
+    return deduped, len(df) - len(deduped), int(empty.sum())
+
+
+def new_upsert_result():
+    return {"inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0, "skipped": 0}
+
+
+def _upsert(conn, table, columns, product_id, df, sql, params, result):
+    # 在同一个写事务中先读出已有记录再写入,新增/更新/未变化的计数是准确的;未变化的行不写入。
+    # 分块导入时每块调用一次,计数累加到同一个 result 中
+    rows, duplicates, skipped = _prepare(df, columns)
+    if result is None:
+        result = new_upsert_result()
+    result["duplicates"] += duplicates
+    result["skipped"] += skipped
+    c = conn.cursor()
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        c.execute("BEGIN IMMEDIATE")
+    try:
+        c.execute(f"SELECT name, {', '.join(columns)} FROM {table} WHERE product_id = ?", (product_id,))
+        existing = {row[0]: row[1:] for row in c.fetchall()}
+        changed = []
+        for row in rows.itertuples(index=False, name=None):
+            old = existing.get(row[0])
+            if old is None:
+                result["inserted"] += 1
+            elif old == row[1:]:
+                result["unchanged"] += 1
+                continue
+            else:
+                result["updated"] += 1
+            changed.append(params(row))
+        c.executemany(sql, changed)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def upsert_features(conn, product_id, df, result=None):
+    # df 需要 name、name_en、description 列;返回各类行数,键见 new_upsert_result
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return _upsert(conn, "features", ["name_en", "description"], product_id, df, UPSERT_FEATURE_SQL,
+                   lambda row: (product_id, *row, created_at), result)
+
+
+def upsert_slots(conn, product_id, df, result=None):
+    # df 需要 name、description、examples 列
+    return _upsert(conn, "slots", ["description", "examples"], product_id, df, UPSERT_SLOT_SQL,
+                   lambda row: (product_id, *row), result)
+
+
+def describe_upsert(result):
+    # 给页面显示的导入结果
+    message = f"新增 {result['inserted']} 条，更新 {result['updated']} 条，未变化 {result['unchanged']} 条"
+    if result["duplicates"]:
+        message += f"；文件中有 {result['duplicates']} 行名称重复，以最后一行为准"
+    if result["skipped"]:
+        message += f"；跳过 {result['skipped']} 行名称为空的记录"
+    return message
+
+
+# 可以批量修改状态的表 -> ID 列
+STATUS_TABLES = {"features": "feature_id", "intents": "intent_id", "slots": "slot_id"}
+
+
+def set_active(conn, table, product_id, ids, is_active):
+    # 一条 UPDATE 修改产品下若干条记录的激活状态,返回修改的行数
+    id_column = STATUS_TABLES[table]
+    ids = [int(i) for i in ids]
+    c = conn.cursor()
+    c.execute(f"UPDATE {table} SET is_active = ? WHERE product_id = ? AND {id_column} IN ({', '.join('?' * len(ids))})",
+              [int(is_active), product_id] + ids)
+    conn.commit()
+    return c.rowcount
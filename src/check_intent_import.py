@@ -0,0 +1,67 @@
+import io
+import sys
+from collections import Counter
+
+from csv_ingest import ingest_csv
+from db import connect
+from intent_store import NAME_DTYPES, bulk_insert_intents, resolve_intents
+from migrations import migrate
+
+# 意图 CSV 导入的回归检查:按页面的流程(ingest_csv 分块读取 -> resolve_intents -> bulk_insert_intents)
+# 导入几份容易出错的文件,核对导入的行数和未解析的名称。
+# 用法: python check_intent_import.py,使用内存数据库
+
+HEADER = "intent_ch,intent_en,description,feature_name,slot_name\n"
+
+# (说明, CSV 内容, 期望导入的行数, 期望的不存在功能, 期望的不存在 Slot)
+CASES = [
+    ("Slot 列全部为空", HEADER + "开灯,turn on,,灯光,\n关灯,turn off,,灯光,\n", 2, {}, {}),
+    ("功能列全部为空", HEADER + "开灯,turn on,,,\n关灯,turn off,,,\n", 0, {"(空)": 2}, {}),
+    ("数字名称", HEADER + "调到二档,level two,,2,10\n", 1, {}, {}),
+    ("名称不存在", HEADER + "开灯,turn on,,灯光,亮度\n开窗,open,,窗户,\n", 1, {"窗户": 1}, {"亮度": 1}),
+]
+
+
+def seed(conn):
+    migrate(conn)
+    conn.execute("INSERT INTO products (name) VALUES ('check')")
+    conn.executemany("INSERT INTO features (product_id, name) VALUES (1, ?)", [("灯光",), ("2",)])
+    conn.execute("INSERT INTO slots (product_id, name) VALUES (1, '10')")
+    conn.commit()
+
+
+def run(conn, text, chunk_rows, dtype):
+    imported, missing_features, missing_slots = 0, Counter(), Counter()
+
+    def write_chunk(chunk):
+        nonlocal imported
+        rows, chunk_missing_features, chunk_missing_slots = resolve_intents(conn, chunk, 1)
+        imported += bulk_insert_intents(conn, rows, 1)
+        missing_features.update(chunk_missing_features)
+        missing_slots.update(chunk_missing_slots)
+
+    ingest_csv(io.BytesIO(text.encode("utf-8")), write_chunk, chunk_rows=chunk_rows, dtype=dtype)
+    return imported, dict(missing_features), dict(missing_slots)
+
+
+def main():
+    failures = 0
+    for name, text, *expected in CASES:
+        # 每行一块时,只有部分块的 Slot 为空也能覆盖到;
+        # 不传 dtype 时整列为空的名称列是 float64,检查 resolve_intents 自身能处理
+        for chunk_rows, dtype in ((1, NAME_DTYPES), (1000, NAME_DTYPES), (1000, None)):
+            conn = connect(":memory:")
+            seed(conn)
+            try:
+                result = list(run(conn, text, chunk_rows, dtype))
+            except Exception as e:
+                result = f"{type(e).__name__}: {e}"
+            conn.close()
+            ok = result == expected
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name} (每块 {chunk_rows} 行{'' if dtype else ', 不指定 dtype'})" + ("" if ok else f": {result} != {expected}"))
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
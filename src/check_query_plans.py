@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pandas as pd
+
+import cascade
+import catalog
+import catalog_store
+import corpus_export
+import corpus_store
+import dedup
+import gen_jobs
+from db import connect
+from feature import FEATURE_LIST_SQL
+from intent import INTENT_LIST_SQL
+from migrations import migrate
+from slot import SLOT_LIST_SQL
+
+# EXPLAIN QUERY PLAN 回归检查:页面上的热点查询不能退化成对大表的全表扫描。
+# 索引定义在 migrations.INDEXES。检查的语句不是抄写在这里的,而是实际调用各模块的查询函数,
+# 通过 set_trace_callback 收集执行过的 SQL(参数已展开为字面值)再逐条 EXPLAIN。
+# 新增页面查询时在 cases() 中加一项调用
+# 用法: python check_query_plans.py [数据库文件],不传参数时使用内存数据库。
+# 传入的数据库文件不会被修改:先复制到临时目录,迁移和写操作都在副本上进行
+
+# 允许全表扫描的表:products 很小;corpus_import 是导入暂存表,解析时本来就要逐行处理
+ALLOWED_SCANS = {"products", "corpus_import"}
+
+# 只检查这些语句,事务控制、PRAGMA、临时表 DDL 以及触发器内的语句(-- TRIGGER ...)跳过
+CHECKED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+
+# 写操作使用不存在的 ID,查询计划相同,但不会在副本上删除大量数据
+MISSING = -1
+
+
+def _stage_import(conn, product_id):
+    corpus_store.create_import_staging(conn)
+    corpus_store.stage_import_chunk(conn, pd.DataFrame(
+        [["意图", "intent", "phrase", 0.5, 1]], columns=corpus_store.IMPORT_COLUMNS))
+    corpus_store.resolve_import_staging(conn, product_id)
+    corpus_store.import_staging_summary(conn)
+    corpus_store.import_staging_preview(conn, errors_only=True)
+
+
+def _export(conn, product_id, intent_id):
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_export.write_corpus_csv(conn, os.path.join(tmp, "corpus.csv"), product_id, intent_id)
+        corpus_export.write_training_jsonl(conn, os.path.join(tmp, "corpus.jsonl"), product_id, intent_id)
+
+
+def _generation_job(conn):
+    job_id = gen_jobs.create_job(conn, MISSING, "plans", 1)
+    gen_jobs.recover_stale_tasks(conn, job_id)
+    gen_jobs.claim_tasks(conn, job_id, 4)
+    gen_jobs.task_counts(conn, job_id)
+    gen_jobs.list_jobs(conn, MISSING)
+    gen_jobs.list_tasks(conn, job_id)
+
+
+def cases(p, f, i):
+    # (说明, 调用);p / f / i 为数据库中实际存在的产品、功能、意图 ID(空库时为 1)
+    search = {"product_id": p, "search": "x"}
+    page_sorts = [(sort, {}) for sort in corpus_store.CORPUS_SORT_COLUMNS]
+    page_sorts += [(sort, {"search": "x"}) for sort in ("ID", corpus_store.RELEVANCE_SORT)]
+    return [
+        ("下拉框", lambda conn: (catalog.products(conn), catalog.features(conn, p), catalog.slots(conn, p),
+                                 catalog.intents(conn, p), catalog.intents(conn, p, f))),
+        ("功能列表", lambda conn: conn.execute(FEATURE_LIST_SQL, (p,)).fetchall()),
+        ("Slot 列表", lambda conn: conn.execute(SLOT_LIST_SQL, (p,)).fetchall()),
+        ("意图列表", lambda conn: (conn.execute(INTENT_LIST_SQL.format(where=""), (p,)).fetchall(),
+                                   conn.execute(INTENT_LIST_SQL.format(where="AND i.feature_id = ?"), (p, f)).fetchall())),
+        ("语料计数", lambda conn: (corpus_store.count_corpus(conn, p), corpus_store.count_corpus(conn, p, is_active=1),
+                                   corpus_store.count_corpus(conn, p, feature_id=f),
+                                   corpus_store.count_corpus(conn, p, intent_id=i))),
+        ("语料搜索计数", lambda conn: (corpus_store.count_corpus(conn, **search),
+                                       corpus_store.count_corpus(conn, **search, limit=corpus_store.SEARCH_COUNT_LIMIT))),
+        ("语料分页", lambda conn: [corpus_store.corpus_page(conn, p, sort=sort, descending=True, **kw)
+                                   for sort, kw in page_sorts]),
+        ("语料分页(功能/意图)", lambda conn: (corpus_store.corpus_page(conn, p, feature_id=f),
+                                             corpus_store.corpus_page(conn, p, intent_id=i),
+                                             corpus_store.corpus_page(conn, p, feature_id=f, search="x"))),
+        ("语料导入暂存", lambda conn: _stage_import(conn, p)),
+        ("批量更新语料状态", lambda conn: (corpus_store.set_corpus_active(conn, True, corpus_ids=[MISSING]),
+                                           corpus_store.set_corpus_active(conn, True, corpus_ids=range(-1000, 0)))),
+        ("按筛选条件删除语料", lambda conn: corpus_store.delete_corpus(
+            conn, corpus_filter={"product_id": MISSING, "feature_id": MISSING})),
+        ("批量更新状态", lambda conn: [catalog_store.set_active(conn, table, p, [MISSING], True)
+                                       for table in catalog_store.STATUS_TABLES]),
+        ("级联删除", lambda conn: (cascade.delete_features(conn, p, [MISSING]), cascade.delete_intents(conn, p, [MISSING]),
+                                   cascade.delete_slots(conn, p, [MISSING]))),
+        ("去重索引加载", lambda conn: dedup.get_index(conn, i)),
+        ("生成任务", _generation_job),
+        ("导出", lambda conn: _export(conn, p, i)),
+    ]
+
+
+def collect(conn, call):
+    # 执行 call(conn),返回其间执行过的需要检查的语句(去重,保持顺序)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call(conn)
+    finally:
+        conn.set_trace_callback(None)
+    checked = (sql.strip() for sql in statements)
+    return list(dict.fromkeys(sql for sql in checked if sql.upper().startswith(CHECKED_STATEMENTS)))
+
+
+def full_scans(conn, sql, params=()):
+    # 返回查询计划中被全表扫描的表(SCAN 后面跟的是表名或别名)
+    aliases = {}
+    tokens = sql.replace(",", " ").split()
+    for i, token in enumerate(tokens[:-1]):
+        if token.upper() in ("FROM", "JOIN", "UPDATE", "INTO"):
+            table = tokens[i + 1]
+            aliases[table] = table
+            if i + 2 < len(tokens) and tokens[i + 2].upper() not in ("ON", "WHERE", "JOIN", "LEFT", "SET", "ORDER", "GROUP", "LIMIT"):
+                aliases[tokens[i + 2]] = table
+    scans = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+        detail = row[-1]
+        # FTS5 虚拟表的 idxStr 中带 M 表示使用了 MATCH(走全文索引),不算全表扫描
+        if detail.startswith("SCAN ") and not ("VIRTUAL TABLE INDEX" in detail and "M" in detail.split(":", 1)[-1]):
+            name = detail.split()[1]
+            table = aliases.get(name, name).split(".")[-1]
+            # (subquery-N) 是扫描已物化的子查询结果;corpus_fts_* 是 FTS5 内部读取的影子表
+            if name.startswith("(") or table.startswith("corpus_fts_"):
+                continue
+            if table not in ALLOWED_SCANS:
+                scans.append(f"{table}: {detail}")
+    return scans
+
+
+def _first_id(conn, sql):
+    row = conn.execute(sql).fetchone()
+    return row[0] if row else 1
+
+
+def open_copy(path, directory):
+    # 用 backup 把数据库(含 WAL 中尚未 checkpoint 的内容)复制到 directory,返回副本上的连接。
+    # 原文件以只读方式打开
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    copy = os.path.join(directory, "query_plans.db")
+    target = sqlite3.connect(copy)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return connect(copy)
+
+
+def check(conn):
+    migrate(conn)
+    p = _first_id(conn, "SELECT product_id FROM products ORDER BY product_id LIMIT 1")
+    f = _first_id(conn, f"SELECT feature_id FROM features WHERE product_id = {p} ORDER BY feature_id LIMIT 1")
+    i = _first_id(conn, f"SELECT intent_id FROM intents WHERE product_id = {p} ORDER BY intent_id LIMIT 1")
+    failures = 0
+    for name, call in cases(p, f, i):
+        # 每组调用后立即 EXPLAIN,它创建的临时表此时还在
+        statements = collect(conn, call)
+        failed = [(sql, scans) for sql in statements for scans in [full_scans(conn, sql)] if scans]
+        failures += len(failed)
+        print(f"{'FAIL' if failed else 'ok  '} {name} ({len(statements)} 条语句)")
+        for sql, scans in failed:
+            print(f"     {'; '.join(scans)}\n     {' '.join(sql.split())}")
+    return failures
+
+
+def main(path=None):
+    if path is None:
+        return check(connect(":memory:"))
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = open_copy(path, tmp)
+        try:
+            return check(conn)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(*sys.argv[1:]) else 0)
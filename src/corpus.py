@@ -5,6 +5,26 @@ from datetime import datetime
 from st_aggrid import AgGrid, GridOptionsBuilder
 import chardet
 import io
+from corpus_store import (count_corpus, corpus_page, fts_query, CORPUS_PAGE_COLUMNS,
+                          CORPUS_SEARCH_COLUMNS, CORPUS_SORT_COLUMNS, RELEVANCE_SORT, SEARCH_COUNT_LIMIT,
+                          create_import_staging, stage_import_chunk, resolve_import_staging, has_import_staging,
+                          import_staging_summary, import_staging_preview, commit_import_staging, drop_import_staging,
+                          set_corpus_active, delete_corpus)
+import catalog
+from corpus_export import ExportJob, BACKGROUND_EXPORT_ROWS, EXPORT_FILE_TYPES
+from db import database_path
+from csv_ingest import ingest_csv
+
+# 语料表格每页条数的可选值
+CORPUS_PAGE_SIZES = [50, 100, 200, 500]
+
+
+# 后台导出时每秒刷新一次进度,完成后整页重跑以显示下载按钮
+@st.fragment(run_every=1)
+def _export_progress(job):
+    if job.done:
+        st.rerun()
+    st.progress(min(job.written / job.total, 1.0), text=f"正在后台导出 {job.written}/{job.total} 条语料")
 
 
 def manage_corpus(conn):
@@ -12,13 +32,10 @@ def manage_corpus(conn):
 
     if 'upload_state' not in st.session_state:
      st.session_state.upload_state = 'initial'
-    if 'preview_data' not in st.session_state:
-        st.session_state.preview_data = None
 
     # 获取所有产品
     c = conn.cursor()
-    c.execute("SELECT product_id, name FROM products")
-    products = c.fetchall()
+    products = catalog.products(conn)
 
     # 创建产品选择下拉框
     product_options = {product[1]: product[0] for product in products}
@@ -27,9 +44,15 @@ def manage_corpus(conn):
     # 获取选中产品的ID
     product_id = product_options[selected_product]
 
-    # 获取该产品下的所有意图
-    c.execute("SELECT intent_id, intent_ch FROM intents WHERE product_id = ?", (product_id,))
-    intents = c.fetchall()
+    # 功能下拉框,选中功能时意图列表只列该功能下的意图
+    features = catalog.features(conn, product_id)
+    feature_options = {"全部": None}
+    feature_options.update({feature[1]: feature[0] for feature in features})
+    selected_feature = st.selectbox("选择功能", options=list(feature_options.keys()), index=0)
+    selected_feature_id = feature_options[selected_feature]
+
+    # 获取该产品(功能)下的所有意图
+    intents = catalog.intents(conn, product_id, selected_feature_id)
     intent_options = {"全部": None}
     intent_options.update({intent[1]: intent[0] for intent in intents})
 
@@ -37,36 +60,65 @@ def manage_corpus(conn):
     selected_intent = st.selectbox("选择意图", options=list(intent_options.keys()), index=0)
     selected_intent_id = intent_options[selected_intent]
 
-    # 修改查询语句
-    if selected_intent_id:
-        c.execute("""
-            SELECT f.name as feature_zh, f.name_en as feature_en, 
-                   i.intent_ch, i.intent_en, c.intent_en as corpus, c.score,
-                   c.corpus_id, c.is_active
-            FROM corpus c
-            JOIN intents i ON c.intent_id = i.intent_id
-            LEFT JOIN features f ON i.feature_id = f.feature_id
-            WHERE i.intent_id = ?
-        """, (selected_intent_id,))
+    # 过滤、排序和分页条件,只查询并显示当前页
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
+    with col1:
+        search = st.text_input("搜索语料", key="corpus_search", help="全文搜索,每个词按前缀匹配")
+    with col2:
+        active_filter = st.selectbox("激活状态", ["全部", "已激活", "未激活"], key="corpus_active_filter")
+    with col3:
+        # 搜索时可以按相关度排序,并作为默认排序
+        sort_options = list(CORPUS_SORT_COLUMNS.keys())
+        if fts_query(search):
+            sort_options.insert(0, RELEVANCE_SORT)
+        sort = st.selectbox("排序", sort_options, key="corpus_sort")
+    with col4:
+        descending = st.checkbox("倒序", key="corpus_descending")
+    is_active = {"全部": None, "已激活": 1, "未激活": 0}[active_filter]
+    # 只有标点等不构成搜索词的输入按未搜索处理
+    if not fts_query(search):
+        search = None
+
+    # 过滤条件变化时回到第一页
+    filter_key = (product_id, selected_feature_id, selected_intent_id, search, is_active, sort, descending)
+    if st.session_state.get('corpus_filter_key') != filter_key:
+        st.session_state.corpus_filter_key = filter_key
+        st.session_state.corpus_page = 1
+
+    total_label = None
+    if search:
+        # 搜索结果只数到 SEARCH_COUNT_LIMIT 条;匹配太多时不按相关度打分,按 ID 顺序翻页
+        total = count_corpus(conn, product_id, selected_feature_id, selected_intent_id, search, is_active,
+                             limit=SEARCH_COUNT_LIMIT)
+        if total > SEARCH_COUNT_LIMIT:
+            total = SEARCH_COUNT_LIMIT
+            total_label = f"{SEARCH_COUNT_LIMIT}+"
+            if sort == RELEVANCE_SORT:
+                sort = "ID"
+            st.info(f"匹配的语料超过 {SEARCH_COUNT_LIMIT} 条，只能翻看前 {SEARCH_COUNT_LIMIT} 条且不按相关度排序，请输入更具体的关键词")
     else:
-        c.execute("""
-            SELECT f.name as feature_zh, f.name_en as feature_en, 
-                   i.intent_ch, i.intent_en, c.intent_en as corpus, c.score,
-                   c.corpus_id, c.is_active
-            FROM corpus c
-            JOIN intents i ON c.intent_id = i.intent_id
-            LEFT JOIN features f ON i.feature_id = f.feature_id
-            WHERE i.product_id = ?
-        """, (product_id,))
-
-    corpus_data = c.fetchall()
+        total = count_corpus(conn, product_id, selected_feature_id, selected_intent_id, search, is_active)
+    total_label = total_label or str(total)
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        page_size = st.selectbox("每页条数", CORPUS_PAGE_SIZES, index=1, key="corpus_page_size")
+    page_count = max(1, -(-total // page_size))
+    st.session_state.corpus_page = min(st.session_state.corpus_page, page_count)
+    with col2:
+        page = st.number_input("页码", min_value=1, max_value=page_count, step=1, key="corpus_page")
+    with col3:
+        st.caption(f"共 {total} 条语料，{page_count} 页")
+
+    corpus_data = corpus_page(conn, product_id, selected_feature_id, selected_intent_id, search, is_active,
+                              sort, descending, page - 1, page_size)
 
     # 更新显示语料列表的部分
     if corpus_data:
-        df = pd.DataFrame(corpus_data, columns=['Feature(zh)', 'Feature(en)', 'Intent(zh)', 'Intent(en)', 'corpus', 'score', 'ID', '是否激活'])
+        df = pd.DataFrame(corpus_data, columns=CORPUS_SEARCH_COLUMNS if search else CORPUS_PAGE_COLUMNS)
         
         gb = GridOptionsBuilder.from_dataframe(df)
-        gb.configure_pagination(paginationAutoPageSize=True)
+        # 排序和过滤已经在 SQL 中完成,表格内只是当前页,关闭表格自带的排序过滤以免误解
+        gb.configure_default_column(sortable=False, filter=False)
         gb.configure_side_bar()
         gb.configure_selection('multiple', use_checkbox=True, groupSelectsChildren="Group checkbox select children")
         gridOptions = gb.build()
@@ -84,12 +136,54 @@ def manage_corpus(conn):
             reload_data=True
         )
 
+        # 批量操作:作用于表格中勾选的行,或当前筛选条件下的全部语料(不限于本页)
         selected = grid_response['selected_rows']
-        if selected:
-            st.write('选中的行:')
-            st.json(selected)
+        selected_ids = [] if selected is None else selected['ID'].tolist()
+        col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+        with col1:
+            scope = st.radio("批量操作范围", ["选中的行", "当前筛选的全部语料"], horizontal=True, key="corpus_bulk_scope",
+                             format_func=lambda option: f"选中的 {len(selected_ids)} 条" if option == "选中的行"
+                             else f"当前筛选的全部 {total_label} 条")
+        if scope == "选中的行":
+            target = {"corpus_ids": selected_ids}
+            target_label = str(len(selected_ids))
+        else:
+            target = {"corpus_filter": dict(product_id=product_id, feature_id=selected_feature_id,
+                                            intent_id=selected_intent_id, search=search, is_active=is_active)}
+            target_label = total_label
+        nothing_selected = scope == "选中的行" and not selected_ids
+        with col2:
+            if st.button("激活", disabled=nothing_selected, key="corpus_bulk_activate"):
+                changed = set_corpus_active(conn, True, **target)
+                st.session_state.corpus_bulk_report = f"已激活 {changed} 条语料"
+                st.rerun()
+        with col3:
+            if st.button("停用", disabled=nothing_selected, key="corpus_bulk_deactivate"):
+                changed = set_corpus_active(conn, False, **target)
+                st.session_state.corpus_bulk_report = f"已停用 {changed} 条语料"
+                st.rerun()
+        with col4:
+            if st.button("删除", disabled=nothing_selected, key="corpus_bulk_delete"):
+                st.session_state.corpus_pending_delete = (target, target_label)
+        # 删除需要再确认一次;确认前筛选或勾选变化不影响要删除的范围
+        if st.session_state.get('corpus_pending_delete') is not None:
+            pending, pending_label = st.session_state.corpus_pending_delete
+            st.warning(f"确认删除 {pending_label} 条语料？删除后无法恢复。")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("确认删除", type="primary"):
+                    deleted = delete_corpus(conn, **pending)
+                    st.session_state.corpus_pending_delete = None
+                    st.session_state.corpus_bulk_report = f"已删除 {deleted} 条语料"
+                    st.rerun()
+            with col2:
+                if st.button("取消删除"):
+                    st.session_state.corpus_pending_delete = None
+                    st.rerun()
     else:
         st.info("没有找到相关语料")
+    if 'corpus_bulk_report' in st.session_state:
+        st.success(st.session_state.pop('corpus_bulk_report'))
 
     # 添加新语料
     st.subheader("添加新语料", divider="rainbow")
@@ -138,67 +232,53 @@ def manage_corpus(conn):
     # 文件上传
     uploaded_file = st.file_uploader("选择CSV文件上传", type="csv")
 
-    if uploaded_file is not None and st.session_state.upload_state == 'initial':
-        # 读取CSV文件
-        df = pd.read_csv(uploaded_file)
-        
-        # 处理数据并创建preview_data
-        preview_data = []
-        for _, row in df.iterrows():
-            # 这里添加处理每行数据的逻辑
-            preview_data.append({
-                'intent_ch': row['intent_ch'],
-                'intent_en': row['intent_en'],
-                'corpus_en': row['corpus_en'],
-                'score': row['score'],
-                'is_active': row['is_active'],
-                'status': '准备导入'  # 可以根据需要设置状态
-            })
+    # 暂存表在会话的连接上,连接被重建(如服务重启)后回到初始状态
+    if st.session_state.upload_state == 'preview' and not has_import_staging(conn):
+        st.session_state.upload_state = 'initial'
 
+    if uploaded_file is not None and st.session_state.upload_state == 'initial':
         if st.button("确认导入"):
-            # 将预览数据保存到session state
-            st.session_state.preview_data = preview_data
+            # 分块读取CSV文件(自动识别编码)写入暂存表,再在 SQL 中解析意图并校验
+            create_import_staging(conn)
+            progress = st.progress(0.0, text="正在读取文件...")
+            ingest_csv(uploaded_file, lambda chunk: stage_import_chunk(conn, chunk),
+                       on_progress=lambda rows, ratio: progress.progress(ratio, text=f"已读取 {rows} 行"))
+            resolve_import_staging(conn, product_id)
             st.session_state.upload_state = 'preview'
+            st.session_state.import_product = selected_product
             st.rerun()
 
     if st.session_state.upload_state == 'preview':
-        # 显示预览数据
-        st.write("导入预览:")
-        preview_df = pd.DataFrame(st.session_state.preview_data)
+        # 预览和统计都直接查询暂存表
+        total, ok, errors = import_staging_summary(conn)
+        st.write(f"导入预览（产品：{st.session_state.import_product}）：共 {total} 行，可导入 {ok} 行")
+        if errors:
+            st.warning("以下行不会导入：" + "，".join(f"{error} {count} 行" for error, count in errors.items()))
+        errors_only = st.checkbox("只看有问题的行", value=bool(errors))
+        preview_df = pd.DataFrame(import_staging_preview(conn, errors_only),
+                                  columns=['行号', 'intent_ch', 'intent_en', 'corpus_en', 'score', 'is_active', '意图ID', 'status'])
         st.dataframe(preview_df, use_container_width=True)
 
-        if st.button("确认最终导入"):
-            st.session_state.upload_state = 'importing'
-            st.rerun()
-
-    if st.session_state.upload_state == 'importing':
-        success_count = 0
-        error_count = 0
-        try:
-            for row in st.session_state.preview_data:
-                if row['status'] == '准备导入':
-                    try:
-                        c.execute("""
-                            INSERT INTO corpus (intent_id, intent_en, score, is_active)
-                            VALUES (?, ?, ?, ?)
-                        """, (row['intent_id'], row['corpus_en'], row['score'], row['is_active']))
-                        success_count += 1
-                    except Exception as e:
-                        st.error(f"导入错误: {str(e)}")
-                        error_count += 1
-                else:
-                    error_count += 1
-
-            conn.commit()
-            st.success(f"成功导入 {success_count} 条语料，失败 {error_count} 条")
-        except Exception as e:
-            st.error(f"导入过程中发生错误: {str(e)}")
-        finally:
-            st.session_state.upload_state = 'initial'
-            st.session_state.preview_data = None
-            if st.button("刷新页面"):
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("确认最终导入", disabled=ok == 0):
+                try:
+                    success_count = commit_import_staging(conn)
+                    st.session_state.import_report = ("success", f"成功导入 {success_count} 条语料，失败 {total - success_count} 条")
+                except Exception as e:
+                    st.session_state.import_report = ("error", f"导入过程中发生错误: {str(e)}")
+                st.session_state.upload_state = 'initial'
+                st.rerun()
+        with col2:
+            if st.button("取消导入"):
+                drop_import_staging(conn)
+                st.session_state.upload_state = 'initial'
                 st.rerun()
 
+    if 'import_report' in st.session_state:
+        level, message = st.session_state.pop('import_report')
+        getattr(st, level)(message)
+
     # 将导出功能移到这里（页面最后）
     st.subheader("导出语料", divider="rainbow")
 
@@ -212,51 +292,55 @@ def manage_corpus(conn):
             mime="text/csv",
         )
 
-    # 导出全部语料
-    export_format = st.radio("选择导出格式", ["中英文","中文", "英文"], index=0)
-
-    if st.button("导出全部语料"):
-        # 构建查询
-        query = """
-            SELECT f.name as feature_zh, f.name_en as feature_en, 
-                   i.intent_ch, i.intent_en, c.intent_en as corpus, c.score
-            FROM corpus c
-            JOIN intents i ON c.intent_id = i.intent_id
-            LEFT JOIN features f ON i.feature_id = f.feature_id
-            WHERE i.product_id = ?
-        """
-        params = [product_id]
-
-        if selected_intent_id:
-            query += " AND i.intent_id = ?"
-            params.append(selected_intent_id)
-
-        c.execute(query, params)
-        all_corpus_data = c.fetchall()
-
-        if all_corpus_data:
-            df_export = pd.DataFrame(all_corpus_data, columns=['Feature(zh)', 'Feature(en)', 'Intent(zh)', 'Intent(en)', 'corpus', 'score'])
-
-            # 根据选择的格式调整DataFrame
-            if export_format == "中文":
-                df_export = df_export[['Feature(zh)', 'Intent(zh)', 'corpus', 'score']]
-            elif export_format == "英文":
-                df_export = df_export[['Feature(en)', 'Intent(en)', 'corpus', 'score']]
-            # 中英文格式保持原样
-
-            # 创建CSV
-            csv = df_export.to_csv(index=False, encoding='utf-8-sig')
-
-            # 创建下载按钮时也指定编码
-            st.download_button(
-                label=f"下载{export_format}CSV文件",
-                data=csv.encode('utf-8-sig'),
-                file_name=f"all_corpus_export_{export_format}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv",
-            )
+    # 导出全部语料;CSV 可选择语言,训练格式导出激活的语料并带上功能、意图和 Slot 列
+    file_type = st.radio("文件类型", EXPORT_FILE_TYPES, index=0, horizontal=True, key="corpus_export_file_type",
+                         help="JSONL / Parquet / Arrow 供训练使用，只包含激活的语料；Arrow 文件可以内存映射零拷贝读取")
+    if file_type == "CSV":
+        export_format = st.radio("选择导出格式", ["中英文","中文", "英文"], index=0)
+    else:
+        export_format = None
+
+    # 导出在后台进行时不允许再次导出,导出结束后文件保留到被下载或重新导出
+    job = st.session_state.get('corpus_export')
+    exporting = job is not None and not job.done
+    if st.button("导出全部语料", disabled=exporting) and not exporting:
+        if job is not None:
+            job.discard()
+            job = st.session_state.corpus_export = None
+        total = count_corpus(conn, product_id, intent_id=selected_intent_id,
+                             is_active=None if file_type == "CSV" else 1)
+        if total:
+            job = ExportJob(database_path(conn), product_id, selected_intent_id, export_format, total, file_type)
+            st.session_state.corpus_export = job
+            if total > BACKGROUND_EXPORT_ROWS:
+                job.start()
+                st.rerun()
+            else:
+                with st.spinner("正在导出..."):
+                    job.run()
         else:
             st.info("没有找到相关语料")
 
+    if job is not None:
+        if not job.done:
+            _export_progress(job)
+        elif job.error:
+            st.error(f"导出失败: {job.error}")
+            job.discard()
+            st.session_state.corpus_export = None
+        else:
+            with open(job.path, "rb") as f:
+                name = f"{job.export_format}CSV" if job.file_type == "CSV" else job.file_type
+                downloaded = st.download_button(
+                    label=f"下载{name}文件（{job.total} 条）",
+                    data=f,
+                    file_name=f"all_corpus_export_{job.export_format or 'train'}_{job.created_at}{job.suffix}",
+                    mime=job.mime,
+                )
+            if downloaded:
+                job.discard()
+                st.session_state.corpus_export = None
+
     # 在这里可以添更多功能，如批量导入、导出等
 
 # 在 app.py 中调用这个函数
@@ -0,0 +1,216 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from db import connect
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # pyarrow 是可选依赖,没有安装时只能导出 CSV 和 JSONL
+    pa = pq = None
+
+# 语料导出:按块从游标读取,逐块写入临时文件(CSV,或训练用的 JSONL / Parquet / Arrow),
+# 内存占用与语料总量无关。语料很多时放到后台线程执行,页面只轮询进度
+
+# 导出格式 -> (表头, 查询列)
+EXPORT_FORMATS = {
+    "中英文": (['Feature(zh)', 'Feature(en)', 'Intent(zh)', 'Intent(en)', 'corpus', 'score'],
+              "f.name, f.name_en, i.intent_ch, i.intent_en, c.intent_en, c.score"),
+    "中文": (['Feature(zh)', 'Intent(zh)', 'corpus', 'score'],
+            "f.name, i.intent_ch, c.intent_en, c.score"),
+    "英文": (['Feature(en)', 'Intent(en)', 'corpus', 'score'],
+            "f.name_en, i.intent_en, c.intent_en, c.score"),
+}
+
+# 每次 fetchmany 的行数,同时也是进度回调的粒度
+EXPORT_CHUNK_SIZE = 10000
+
+# 超过这个行数的导出在后台线程执行
+BACKGROUND_EXPORT_ROWS = 200000
+
+# 文件类型 -> (扩展名, MIME 类型)。CSV 按 EXPORT_FORMATS 选择列,给人看;
+# 其余是给训练用的格式,只导出激活的语料,列固定为 TRAINING_COLUMNS
+FILE_TYPES = {
+    "CSV": (".csv", "text/csv"),
+    "JSONL": (".jsonl", "application/jsonl"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "Arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+# 当前环境可用的文件类型
+EXPORT_FILE_TYPES = [name for name in FILE_TYPES if pa is not None or name not in ("Parquet", "Arrow")]
+
+# 训练数据:每条语料带上功能、意图和 Slot(语料没有单独关联 Slot 时取意图的 Slot)。
+# 名称列统一 CAST 成文本,CSV 导入的纯数字名称在库里可能是整数
+TRAINING_QUERY = """
+    SELECT c.corpus_id, CAST(c.intent_en AS TEXT), c.score,
+           f.feature_id, CAST(f.name AS TEXT), CAST(f.name_en AS TEXT),
+           i.intent_id, CAST(i.intent_ch AS TEXT), CAST(i.intent_en AS TEXT),
+           s.slot_id, CAST(s.name AS TEXT)
+    FROM corpus c
+    JOIN intents i ON c.intent_id = i.intent_id
+    LEFT JOIN features f ON i.feature_id = f.feature_id
+    LEFT JOIN slots s ON s.slot_id = COALESCE(c.slot_id, i.slot_id)
+    WHERE i.product_id = ? AND c.is_active = 1
+"""
+
+TRAINING_COLUMNS = ["corpus_id", "text", "score", "feature_id", "feature", "feature_en",
+                    "intent_id", "intent", "intent_en", "slot_id", "slot"]
+
+# Parquet / Arrow 每个 row group / record batch 的行数
+ARROW_BATCH_ROWS = 65536
+
+
+def write_corpus_csv(conn, path, product_id, intent_id=None, export_format="中英文",
+                     chunk_size=EXPORT_CHUNK_SIZE, on_progress=None):
+    # 把产品(或单个意图)的语料写入 path,带 BOM 方便 Excel 识别编码;返回写入的行数
+    # on_progress: 每写完一块调用一次,参数为已写入的总行数
+    header, columns = EXPORT_FORMATS[export_format]
+    query = f"""
+        SELECT {columns}
+        FROM corpus c
+        JOIN intents i ON c.intent_id = i.intent_id
+        LEFT JOIN features f ON i.feature_id = f.feature_id
+        WHERE i.product_id = ?
+    """
+    params = [product_id]
+    if intent_id is not None:
+        query += " AND c.intent_id = ?"
+        params.append(intent_id)
+
+    c = conn.cursor()
+    c.execute(query, params)
+    written = 0
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(header)
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            written += len(rows)
+            if on_progress is not None:
+                on_progress(written)
+    return written
+
+
+def _training_chunks(conn, product_id, intent_id, chunk_size):
+    # 按块返回训练数据的行,每块是 fetchmany 的结果
+    query, params = TRAINING_QUERY, [product_id]
+    if intent_id is not None:
+        query += " AND c.intent_id = ?"
+        params.append(intent_id)
+    c = conn.cursor()
+    c.execute(query, params)
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def write_training_jsonl(conn, path, product_id, intent_id=None, chunk_size=EXPORT_CHUNK_SIZE, on_progress=None):
+    # 每行一个 JSON 对象,键为 TRAINING_COLUMNS;返回写入的行数
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for rows in _training_chunks(conn, product_id, intent_id, chunk_size):
+            f.write("".join(encode(dict(zip(TRAINING_COLUMNS, row))) + "\n" for row in rows))
+            written += len(rows)
+            if on_progress is not None:
+                on_progress(written)
+    return written
+
+
+def training_schema():
+    return pa.schema([
+        ("corpus_id", pa.int64()), ("text", pa.string()), ("score", pa.float64()),
+        ("feature_id", pa.int64()), ("feature", pa.string()), ("feature_en", pa.string()),
+        ("intent_id", pa.int64()), ("intent", pa.string()), ("intent_en", pa.string()),
+        ("slot_id", pa.int64()), ("slot", pa.string()),
+    ])
+
+
+def _write_batches(conn, writer, schema, product_id, intent_id, chunk_size, on_progress):
+    # 每块行转成一个 RecordBatch 写出,内存中最多只有一块数据
+    written = 0
+    for rows in _training_chunks(conn, product_id, intent_id, chunk_size):
+        columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        writer.write_batch(pa.record_batch(columns, schema=schema))
+        written += len(rows)
+        if on_progress is not None:
+            on_progress(written)
+    return written
+
+
+def write_training_parquet(conn, path, product_id, intent_id=None, chunk_size=ARROW_BATCH_ROWS, on_progress=None):
+    # 每块一个 row group,按列压缩,适合存档和用 pandas / pyarrow 按列读取
+    schema = training_schema()
+    with pq.ParquetWriter(path, schema) as writer:
+        return _write_batches(conn, writer, schema, product_id, intent_id, chunk_size, on_progress)
+
+
+def write_training_arrow(conn, path, product_id, intent_id=None, chunk_size=ARROW_BATCH_ROWS, on_progress=None):
+    # Arrow IPC 文件格式,不压缩:下游用 pa.ipc.open_file(pa.memory_map(path)) 读取时零拷贝
+    schema = training_schema()
+    with pa.ipc.new_file(path, schema) as writer:
+        return _write_batches(conn, writer, schema, product_id, intent_id, chunk_size, on_progress)
+
+
+TRAINING_WRITERS = {
+    "JSONL": write_training_jsonl,
+    "Parquet": write_training_parquet,
+    "Arrow": write_training_arrow,
+}
+
+
+class ExportJob:
+    # 一次导出:结果写到临时文件,run() 同步执行,start() 在后台线程执行。
+    # 后台线程使用自己的连接,页面通过 written / done / error 查看进度。
+    # export_format 只对 CSV 有效
+    def __init__(self, db_path, product_id, intent_id, export_format, total, file_type="CSV"):
+        self.db_path = db_path
+        self.product_id = product_id
+        self.intent_id = intent_id
+        self.export_format = export_format
+        self.file_type = file_type
+        self.total = total
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.created_at = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.suffix, self.mime = FILE_TYPES[file_type]
+        fd, self.path = tempfile.mkstemp(prefix="corpus_export_", suffix=self.suffix)
+        os.close(fd)
+
+    def run(self):
+        conn = connect(self.db_path)
+        try:
+            if self.file_type == "CSV":
+                write_corpus_csv(conn, self.path, self.product_id, self.intent_id, self.export_format,
+                                 on_progress=self._progress)
+            else:
+                TRAINING_WRITERS[self.file_type](conn, self.path, self.product_id, self.intent_id,
+                                                 on_progress=self._progress)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            conn.close()
+            self.done = True
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def _progress(self, written):
+        self.written = written
+
+    def discard(self):
+        # 删除临时文件,只在导出结束后调用
+        if os.path.exists(self.path):
+            os.remove(self.path)
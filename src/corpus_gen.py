@@ -2,29 +2,39 @@ import streamlit as st
 import pandas as pd
 from st_aggrid import AgGrid, GridOptionsBuilder
 import sqlite3
-import igen
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import gen_jobs
+import dedup
+from corpus_store import bulk_insert_corpus
+import gen_metrics
+from gen_cache import response_cache
+import catalog
+
+# 批量生成默认并发数
+DEFAULT_BATCH_CONCURRENCY = 4
+
+# 生成结果表格的列,最后一列是与已有语料近似重复的短语
+GENERATED_COLUMNS = ["意图ID", "槽位ID", "英文意图", "分数", "近似重复"]
 
 def manage_corpus_gen(conn):
     st.subheader("语料生成")
 
     # 获取产品列表
     c = conn.cursor()
-    c.execute("SELECT product_id, name FROM products")
-    products = c.fetchall()
+    products = catalog.products(conn)
     product_options = {p[1]: p[0] for p in products}
     selected_product = st.selectbox("选择产品", list(product_options.keys()), key="product_select")
     selected_product_id = product_options[selected_product]
 
     # 获取功能列表
-    c.execute("SELECT feature_id, name FROM features WHERE product_id = ?", (selected_product_id,))
-    features = c.fetchall()
+    features = catalog.features(conn, selected_product_id)
     feature_options = {f[1]: f[0] for f in features}
     selected_feature = st.selectbox("选择功能", list(feature_options.keys()), key="feature_select")
     selected_feature_id = feature_options[selected_feature]
 
     # 获取意图列表
-    c.execute("SELECT intent_id, intent_ch FROM intents WHERE product_id = ? AND feature_id = ?", (selected_product_id, selected_feature_id))
-    intents = c.fetchall()
+    intents = catalog.intents(conn, selected_product_id, selected_feature_id)
     
     if not intents:
         st.warning("该功能下没有意图,请先添加意图。")
@@ -70,8 +80,17 @@ def manage_corpus_gen(conn):
         with col2:
             num_generations = st.number_input("生成条数", min_value=1, max_value=100, value=10, step=1, key="num_generations")
 
+        # 与已有语料的 Jaccard 相似度超过该阈值视为近似重复,导入时会被跳过
+        dedup_threshold = st.slider("近似重复阈值", min_value=0.5, max_value=1.0, value=dedup.DEFAULT_THRESHOLD, step=0.05, key="dedup_threshold")
+
+        # 相同输入默认直接复用缓存结果,勾选后强制重新生成以获得新的表达
+        bypass_cache = st.checkbox("忽略缓存,重新生成", value=False, key="bypass_cache")
+
         generate_button = st.form_submit_button("一键生成")
 
+    cache_stats = response_cache.stats()
+    st.caption(f"生成缓存: 命中 {cache_stats['hits']} 次, 未命中 {cache_stats['misses']} 次, 共 {cache_stats['entries']} 条")
+
     # 处理 Example 输入,分割成数组
     example_array = [line.strip() for line in corpus_example.split('\n') if line.strip()]
     
@@ -83,22 +102,54 @@ def manage_corpus_gen(conn):
 
     # 生成语料按钮
     if generate_button:
-        st.session_state.generated_corpus = generate_corpus(
-            selected_intent_id,
-            selected_product,
-            selected_intent,
-            intent_description,
-            feature_description,
-            extra_info,
-            selected_style,
-            example_array,
-            num_generations  # 新增参数
-        )
+        import igen  # 延迟导入:LangChain/OpenAI 只在真正生成时加载,不拖慢其它页面
+        # 分块生成,每完成一块就追加到会话状态并刷新表格
+        st.session_state.generated_corpus = []
+        stream_grid = st.empty()
+        batch_index = dedup.MinHashLSH(dedup_threshold)
+        stats = igen.new_stats()
+        start = time.perf_counter()
+        try:
+            for corpus_rows in generate_corpus_stream(
+                selected_intent_id,
+                selected_product,
+                selected_intent,
+                intent_description,
+                feature_description,
+                extra_info,
+                selected_style,
+                example_array,
+                num_generations,  # 新增参数
+                use_cache=not bypass_cache,
+                stats=stats
+            ):
+                # 标记与已有语料或本批次中更早结果近似重复的短语
+                matches = dedup.find_duplicates(conn, selected_intent_id, [row[2] for row in corpus_rows], dedup_threshold, batch=batch_index)
+                for row, match in zip(corpus_rows, matches):
+                    row.append(match or "")
+                st.session_state.generated_corpus.extend(corpus_rows)
+                with stream_grid.container():
+                    st.caption(f"生成中... 已生成 {len(st.session_state.generated_corpus)}/{num_generations} 条")
+                    AgGrid(
+                        pd.DataFrame(st.session_state.generated_corpus, columns=GENERATED_COLUMNS),
+                        fit_columns_on_grid_load=True,
+                        theme='streamlit',
+                        height=300,
+                        key=f"generated_stream_{len(st.session_state.generated_corpus)}"
+                    )
+        except Exception as e:
+            gen_metrics.record(conn, 'single', selected_product_id, selected_intent_id, igen.get_backend().model_name,
+                               (time.perf_counter() - start) * 1000, stats, num_generations, error=e)
+            raise
+        stream_grid.empty()
+        kept = sum(1 for row in st.session_state.generated_corpus if not row[4])
+        gen_metrics.record(conn, 'single', selected_product_id, selected_intent_id, igen.get_backend().model_name,
+                           (time.perf_counter() - start) * 1000, stats, num_generations, phrases_kept=kept)
 
     # 显示生成的语料
     if st.session_state.generated_corpus is not None:
         st.subheader("生成的语料")
-        df = pd.DataFrame(st.session_state.generated_corpus, columns=["意图ID", "槽位ID", "英文意图", "分数"])
+        df = pd.DataFrame(st.session_state.generated_corpus, columns=GENERATED_COLUMNS)
         
         gb = GridOptionsBuilder.from_dataframe(df)
         gb.configure_selection('multiple', use_checkbox=True)
@@ -133,10 +184,9 @@ def manage_corpus_gen(conn):
 
         # 如果导入按钮被点击,执行导入操作
         if st.session_state.import_clicked:
-            st.write("开始导入语料...")
-            st.write(f"数据: {updated_df}")
+            st.write(f"开始导入语料,共 {len(updated_df)} 条...")
             try:
-                import_corpus(conn, updated_df, selected_intent_id)
+                import_corpus(conn, updated_df, selected_intent_id, dedup_threshold)
                 st.success("语料已成功导入")
                 # 重置导入状态
                 st.session_state.import_clicked = False
@@ -145,22 +195,55 @@ def manage_corpus_gen(conn):
                 st.error(f"导入过程中出错: {str(e)}")
             st.write("导入过程完成")
 
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4, col5 = st.columns(5)
     with col1:
         style_options = ["常规(Normal)", "正式(Formal)", "随意(Casual)", "口语化(Colloquial)"]
         selected_style = st.selectbox("选择风格", style_options, key="style_select_patch")
     with col2:
         num_generations = st.number_input("生成条数", min_value=1, max_value=100, value=10, step=1, key="num_generations_patch")
     with col3:
+        max_workers = st.number_input("并发数", min_value=1, max_value=32, value=DEFAULT_BATCH_CONCURRENCY, step=1, key="batch_concurrency")
+    with col4:
+        # 上面的复选框在表单里,提交表单前改动不会生效,批量生成单独放一个
+        batch_bypass_cache = st.checkbox("忽略缓存,重新生成", value=bypass_cache, key="batch_bypass_cache")
+    with col5:
         batch_generate_button = st.button("产品批量生成")
 
     if batch_generate_button:
         if not intents:
             st.error("该产品下没有意图,无法进行批量生成。请先添加意图。")
         else:
-            batch_generate_corpus(conn, selected_product_id, selected_style, num_generations)
+            batch_generate_corpus(conn, selected_product_id, selected_style, num_generations, max_workers=max_workers,
+                                  dedup_threshold=dedup_threshold, use_cache=not batch_bypass_cache)
+
+    # 批量生成任务状态
+    st.subheader("批量生成任务", divider="rainbow")
+    jobs = gen_jobs.list_jobs(conn, selected_product_id)
+    if jobs:
+        jobs_df = pd.DataFrame(jobs, columns=["任务ID", "风格", "生成条数", "状态", "创建时间", "更新时间", "待处理", "执行中", "已完成", "失败"])
+        st.dataframe(jobs_df, use_container_width=True)
 
-def generate_corpus(intent_id, product_name, intent_name, intent_description, feature_description, extra_info, style, examples, nums):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            selected_job_id = st.selectbox("选择任务", jobs_df["任务ID"].tolist(), key="job_select")
+        with col2:
+            resume_button = st.button("继续执行")
+        with col3:
+            retry_button = st.button("重试失败意图")
+
+        if retry_button:
+            gen_jobs.retry_failed(conn, selected_job_id)
+        if resume_button or retry_button:
+            run_generation_job(conn, selected_job_id, max_workers=max_workers, dedup_threshold=dedup_threshold)
+
+        with st.expander("任务明细"):
+            tasks_df = pd.DataFrame(gen_jobs.list_tasks(conn, selected_job_id),
+                                    columns=["ID", "功能", "意图", "状态", "尝试次数", "条数", "错误"])
+            st.dataframe(tasks_df, use_container_width=True)
+    else:
+        st.info("该产品还没有批量生成任务")
+
+def generate_corpus(intent_id, product_name, intent_name, intent_description, feature_description, extra_info, style, examples, nums, use_cache=True):
     # 这里应该实现您的语料生成逻辑
     # 现在只返回一些示例数据
     # 导入必要的库
@@ -177,7 +260,43 @@ def generate_corpus(intent_id, product_name, intent_name, intent_description, fe
     st.write(f"示例: {examples}")
 
     # 根据提供的信息生成语料
-    generated_phrases = igen.generate(
+    generated_phrases = _generate_phrases(product_name, intent_name, extra_info, style, examples, nums, use_cache)
+    
+    st.text("info: " + str(generated_phrases))
+
+    return _to_corpus_rows(intent_id, generated_phrases)
+
+    # # 处理生成的语料
+    # corpus = []
+    # for i, phrase in enumerate(generated_phrases, start=1):
+    #     corpus.append([intent_id, i, phrase, 0.9])  # 假设每个短语的分数为0.9
+    # return [
+    #     [1, 1, "Example corpus 1", 0.9],
+    #     [1, 2, "Example corpus 2", 0.8],
+    #     [1, 3, "Example corpus 3", 0.7],
+    # ]
+
+def generate_corpus_stream(intent_id, product_name, intent_name, intent_description, feature_description, extra_info, style, examples, nums, use_cache=True, chunk_size=5, stats=None):
+    import igen
+
+    for instruction in igen.generate_stream(
+        subject=product_name,
+        operation=intent_name,
+        style=style.split('(')[1].strip(')'),  # 只取英文部分
+        examples=examples,
+        slots="",
+        n=nums,
+        extra=extra_info,
+        chunk_size=chunk_size,
+        use_cache=use_cache,
+        stats=stats
+    ):
+        yield _to_corpus_rows(intent_id, [instruction])
+
+def _generate_phrases(product_name, intent_name, extra_info, style, examples, nums, use_cache=True, stats=None):
+    # 只调用 igen,不涉及 st 调用,可以在工作线程中执行
+    import igen
+    return igen.generate(
         subject=product_name,
         operation=intent_name,
         style=style.split('(')[1].strip(')'),  # 只取英文部分
@@ -185,11 +304,24 @@ def generate_corpus(intent_id, product_name, intent_name, intent_description, fe
         slots="",
         n=nums,  # 使用用户指定的生成条数
         extra=extra_info,
-        runs=1
+        runs=1,
+        use_cache=use_cache,
+        stats=stats
     )
-    
-    st.text("info: " + str(generated_phrases))
 
+def _generate_with_stats(product_name, intent_name, extra_info, style, examples, nums, use_cache=True):
+    # 在工作线程中执行,不抛出异常,返回 (生成结果, 用量统计, 耗时毫秒, 异常)
+    import igen
+    stats = igen.new_stats()
+    start = time.perf_counter()
+    try:
+        generated_phrases = _generate_phrases(product_name, intent_name, extra_info, style, examples, nums, use_cache, stats=stats)
+        error = None
+    except Exception as e:
+        generated_phrases, error = None, e
+    return generated_phrases, stats, (time.perf_counter() - start) * 1000, error
+
+def _to_corpus_rows(intent_id, generated_phrases):
     # 将生成的语转换为语料数据式
     corpus_data = []
     for instruction in generated_phrases:
@@ -200,37 +332,28 @@ def generate_corpus(intent_id, product_name, intent_name, intent_description, fe
                 phrase,
                 0.9  # 假设默认分数为0.9
             ])
-    
     return corpus_data
 
-    # # 处理生成的语料
-    # corpus = []
-    # for i, phrase in enumerate(generated_phrases, start=1):
-    #     corpus.append([intent_id, i, phrase, 0.9])  # 假设每个短语的分数为0.9
-    # return [
-    #     [1, 1, "Example corpus 1", 0.9],
-    #     [1, 2, "Example corpus 2", 0.8],
-    #     [1, 3, "Example corpus 3", 0.7],
-    # ]
-
-def import_corpus(conn, df, intent_id):
-    c = conn.cursor()
-    st.write("开始执行import_corpus函数")
-    st.write(f"意图ID: {intent_id}")
-    st.write(f"数据: {df}")
-    for _, row in df.iterrows():
-        query = """
-            INSERT INTO corpus (intent_id, slot_id, intent_en, score, is_active)
-            VALUES (?, ?, ?, ?, 1)
-        """
-        st.write(f"SQL 查询语句: {query}")
-        st.write(f"插入的数据: {(intent_id, row['槽位ID'], row['英文意图'], row['分数'])}")
-        
-        c.execute(query, (intent_id, row['槽位ID'], row['英文意图'], row['分数']))
-    conn.commit()
-    st.write("import_corpus函数执行完毕")
+def import_corpus(conn, df, intent_id, dedup_threshold=dedup.DEFAULT_THRESHOLD):
+    # 跳过与已有语料近似重复的短语;dedup_threshold 为 None 时不过滤
+    if dedup_threshold is not None:
+        kept, dropped = dedup.filter_duplicates(conn, intent_id, df['英文意图'].tolist(), dedup_threshold)
+        df = df.iloc[kept]
+        if dropped:
+            st.info(f"跳过 {dropped} 条近似重复语料")
+
+    # tolist() 会把 numpy 标量转换成 sqlite3 可以直接绑定的 Python 类型
+    rows = zip([intent_id] * len(df), df['槽位ID'].tolist(), df['英文意图'].tolist(), df['分数'].tolist(), [1] * len(df))
+    progress_bar = st.progress(0.0)
+    inserted = bulk_insert_corpus(
+        conn, rows,
+        on_progress=lambda done: progress_bar.progress(done / max(len(df), 1), text=f"已导入 {done}/{len(df)} 条")
+    )
+    st.write(f"共导入 {inserted} 条语料")
+    return inserted
 
-def batch_generate_corpus(conn, product_id, style, nums):
+def batch_generate_corpus(conn, product_id, style, nums, max_workers=DEFAULT_BATCH_CONCURRENCY, dedup_threshold=dedup.DEFAULT_THRESHOLD,
+                          use_cache=True):
     c = conn.cursor()
 
     # 获取产品名称和描述
@@ -246,37 +369,105 @@ def batch_generate_corpus(conn, product_id, style, nums):
         return
 
     for feature_id, feature_name, feature_description in features:
-        # 获取所有意图
-        c.execute("SELECT intent_id, intent_ch, description FROM intents WHERE product_id = ? AND feature_id = ?", (product_id, feature_id))
-        intents = c.fetchall()
-
-        if not intents:
+        c.execute("SELECT COUNT(*) FROM intents WHERE product_id = ? AND feature_id = ?", (product_id, feature_id))
+        if c.fetchone()[0] == 0:
             st.warning(f"功能 {feature_name} 下没有意图,跳过该功能。")
-            continue
 
-        for intent_id, intent_name, intent_description in intents:
-            # 获取示例 ,先当作空进行处理
-            examples = []
+    # 每个意图一个任务,持久化到数据库后再执行,中断后可以继续
+    job_id = gen_jobs.create_job(conn, product_id, style, nums, use_cache)
+    run_generation_job(conn, job_id, max_workers=max_workers, dedup_threshold=dedup_threshold)
 
-            # 生成语料
-            generated_corpus = generate_corpus(
-                intent_id,
-                product_name,  # 使用产品名称而不是功能名称
-                intent_name,
-                intent_description,
-                feature_description,
-                feature_description,  # 使用产品描述作为额外信息
-                style,
-                examples,
-                nums
-            )
-
-            # 插入生成的语料
-            for corpus_item in generated_corpus:
-                c.execute("""
-                    INSERT INTO corpus (intent_id, slot_id, intent_en, score, is_active)
-                    VALUES (?, ?, ?, ?, 1)
-                """, (intent_id, corpus_item[1], corpus_item[2], corpus_item[3]))
-
-    conn.commit()
-    st.success(f"已为产品 {product_name} 的所有功能和意图生成并插入语料")
\ No newline at end of file
+
+def run_generation_job(conn, job_id, max_workers=DEFAULT_BATCH_CONCURRENCY, dedup_threshold=dedup.DEFAULT_THRESHOLD):
+    import igen
+    c = conn.cursor()
+    # 是否读取缓存以创建任务时的选择为准,继续执行和重试失败意图时保持一致
+    _, product_id, style, nums, _, use_cache = gen_jobs.get_job(conn, job_id)
+    use_cache = use_cache is None or bool(use_cache)
+    c.execute("SELECT name FROM products WHERE product_id = ?", (product_id,))
+    product_name = c.fetchone()[0]
+
+    gen_jobs.recover_stale_tasks(conn, job_id)
+    max_workers = max(1, int(max_workers))
+
+    # 每个意图的完成状态
+    progress_bar = st.progress(0.0)
+    status_table = st.empty()
+
+    def refresh_status():
+        tasks_df = pd.DataFrame(gen_jobs.list_tasks(conn, job_id),
+                                columns=["ID", "功能", "意图", "状态", "尝试次数", "条数", "错误"])
+        finished = int(tasks_df["状态"].isin(["done", "failed"]).sum())
+        total = max(len(tasks_df), 1)
+        progress_bar.progress(finished / total, text=f"{finished}/{len(tasks_df)} 个意图已完成")
+        status_table.dataframe(tasks_df, use_container_width=True)
+
+    refresh_status()
+
+    # 并发生成;工作线程只调用 igen,所有 st 和数据库操作都留在当前线程
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        in_flight = []  # 已领取的任务,按 seq 排序,用于按顺序写入
+        results = {}
+
+        def submit_more():
+            for task_id, intent_id, seq in gen_jobs.claim_tasks(conn, job_id, max_workers - len(futures)):
+                c.execute("""SELECT i.intent_ch, f.description
+                             FROM intents i LEFT JOIN features f ON i.feature_id = f.feature_id
+                             WHERE i.intent_id = ?""", (intent_id,))
+                intent_name, feature_description = c.fetchone()
+                # 获取示例 ,先当作空进行处理
+                examples = []
+                future = executor.submit(
+                    _generate_with_stats,
+                    product_name,  # 使用产品名称而不是功能名称
+                    intent_name,
+                    feature_description,  # 使用功能描述作为额外信息
+                    style,
+                    examples,
+                    nums,
+                    use_cache
+                )
+                futures[future] = (task_id, intent_id)
+                in_flight.append(task_id)
+
+        try:
+            submit_more()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id, intent_id = futures.pop(future)
+                    results[task_id] = (intent_id,) + future.result()
+
+                # 按意图原有顺序写入,每个意图单独提交作为检查点
+                while in_flight and in_flight[0] in results:
+                    task_id = in_flight.pop(0)
+                    intent_id, generated_phrases, stats, latency_ms, error = results.pop(task_id)
+                    if error is not None:
+                        gen_jobs.fail_task(conn, task_id, error)
+                        gen_metrics.record(conn, 'batch', product_id, intent_id, igen.get_backend().model_name, latency_ms, stats,
+                                           nums, job_id=job_id, error=error)
+                    else:
+                        corpus_rows = _to_corpus_rows(intent_id, generated_phrases)
+                        if dedup_threshold is not None and corpus_rows:
+                            # 写入前过滤与该意图已有语料近似重复的短语
+                            kept, _ = dedup.filter_duplicates(conn, intent_id, [row[2] for row in corpus_rows], dedup_threshold)
+                            corpus_rows = [corpus_rows[i] for i in kept]
+                        gen_jobs.complete_task(conn, task_id, corpus_rows)
+                        gen_metrics.record(conn, 'batch', product_id, intent_id, igen.get_backend().model_name, latency_ms, stats,
+                                           nums, phrases_kept=len(corpus_rows), job_id=job_id)
+
+                refresh_status()
+                submit_more()
+        finally:
+            # 页面刷新等导致执行中断时,未完成的任务放回队列
+            for future in futures:
+                future.cancel()
+            gen_jobs.release_tasks(conn, in_flight)
+
+    status = gen_jobs.finish_job(conn, job_id)
+    counts = gen_jobs.task_counts(conn, job_id)
+    if status == 'failed':
+        st.warning(f"产品 {product_name} 批量生成完成,{counts['done']} 个意图成功,{counts['failed']} 个意图生成失败,可在下方任务列表中重试")
+    else:
+        st.success(f"已为产品 {product_name} 的所有功能和意图生成并插入语料")
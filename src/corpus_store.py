@@ -0,0 +1,330 @@
+# 语料表的批量写入接口,生成、导入等所有批量写入 corpus 的路径都走这里
+
+import re
+
+# 每批 executemany 的行数,同时也是进度回调的粒度
+BULK_CHUNK_SIZE = 5000
+
+# corpus 上有维护全文索引的触发器(见 migrations._corpus_fts)。逐行 INSERT 时每条语句结束
+# FTS5 都要把内存中的词表写盘,慢一个数量级;所以每批先写入连接私有的临时表,
+# 再用一条 INSERT ... SELECT 写入 corpus,每批只写盘一次
+CREATE_BUFFER_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS corpus_bulk_buffer
+    (intent_id INTEGER, slot_id INTEGER, intent_en TEXT, score FLOAT, is_active BOOLEAN)
+"""
+
+BUFFER_CORPUS_SQL = """
+    INSERT INTO temp.corpus_bulk_buffer (intent_id, slot_id, intent_en, score, is_active)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+INSERT_CORPUS_SQL = """
+    INSERT INTO corpus (intent_id, slot_id, intent_en, score, is_active)
+    SELECT intent_id, slot_id, intent_en, score, is_active FROM temp.corpus_bulk_buffer ORDER BY rowid
+"""
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bulk_insert_corpus(conn, rows, chunk_size=BULK_CHUNK_SIZE, on_progress=None, commit=True):
+    # rows: 可迭代的 (intent_id, slot_id, intent_en, score, is_active)
+    # on_progress: 每写完一批调用一次,参数为已写入的总行数
+    # commit=False 时由调用方提交,用于和其它语句放在同一个事务里
+    # 返回写入的行数
+    c = conn.cursor()
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        # 只在自己开启事务时调整 PRAGMA,结束后恢复连接原来的设置。synchronous 不能在事务中修改。
+        # 不修改 temp_store:它一变化,连接上所有临时表(包括会话的导入暂存表)都会被删除
+        synchronous = c.execute("PRAGMA synchronous").fetchone()[0]
+        cache_size = c.execute("PRAGMA cache_size").fetchone()[0]
+        c.execute("PRAGMA synchronous = NORMAL")
+        c.execute("PRAGMA cache_size = -65536")
+        c.execute("BEGIN")
+    inserted = 0
+    try:
+        c.execute(CREATE_BUFFER_SQL)
+        for chunk in _chunks(rows, chunk_size):
+            c.executemany(BUFFER_CORPUS_SQL, chunk)
+            c.execute(INSERT_CORPUS_SQL)
+            c.execute("DELETE FROM temp.corpus_bulk_buffer")
+            inserted += len(chunk)
+            if on_progress is not None:
+                on_progress(inserted)
+        if commit:
+            conn.commit()
+    except Exception:
+        # 调用方的事务由调用方决定是否回滚
+        if own_transaction:
+            conn.rollback()
+        raise
+    finally:
+        if own_transaction:
+            c.execute(f"PRAGMA cache_size = {cache_size}")
+            if not conn.in_transaction:
+                c.execute(f"PRAGMA synchronous = {synchronous}")
+    return inserted
+
+
+# 语料页表格按页从数据库读取,排序、过滤、分页都在 SQL 中完成,只把当前页发给浏览器
+CORPUS_PAGE_COLUMNS = ['Feature(zh)', 'Feature(en)', 'Intent(zh)', 'Intent(en)', 'corpus', 'score', 'ID', '是否激活']
+
+# 全文搜索时多一列,匹配到的词用【】标出
+CORPUS_SEARCH_COLUMNS = CORPUS_PAGE_COLUMNS + ['匹配']
+
+# 可排序的列 -> SQL 表达式,排序值相同时再按 corpus_id 排,保证分页稳定
+CORPUS_SORT_COLUMNS = {
+    "ID": "c.corpus_id",
+    "语料": "c.intent_en",
+    "分数": "c.score",
+    "意图": "i.intent_ch",
+}
+
+# 全文搜索时额外可用的排序,按 bm25 相关度从高到低
+RELEVANCE_SORT = "相关度"
+
+# 全文搜索最多统计的匹配条数。按相关度排序需要给每条匹配打分,
+# 匹配数在这个范围内时排序只需几毫秒,超过时页面改为按 ID 顺序直接从索引读取
+SEARCH_COUNT_LIMIT = 10000
+
+
+def fts_query(text):
+    # 把输入拆成词,每个词都按前缀匹配,词之间是 AND。
+    # 每个词用双引号包起来,输入中的 FTS5 语法字符(* - : ^ 等)不会被解释
+    return " ".join(f'"{term}"*' for term in re.findall(r"\w+", text or ""))
+
+
+def _corpus_filter(product_id, feature_id=None, intent_id=None, search=None, is_active=None):
+    # 返回 FROM 子句、WHERE 条件和参数;search 是用户输入的搜索词,非空时从全文索引出发再关联 corpus
+    query = fts_query(search)
+    if query:
+        source = """FROM corpus_fts
+        JOIN corpus c ON c.corpus_id = corpus_fts.rowid
+        JOIN intents i ON c.intent_id = i.intent_id"""
+        where = ["corpus_fts MATCH ?", "i.product_id = ?"]
+        params = [query, product_id]
+    else:
+        source = """FROM corpus c
+        JOIN intents i ON c.intent_id = i.intent_id"""
+        where = ["i.product_id = ?"]
+        params = [product_id]
+    if feature_id is not None:
+        where.append("i.feature_id = ?")
+        params.append(feature_id)
+    if intent_id is not None:
+        where.append("c.intent_id = ?")
+        params.append(intent_id)
+    if is_active is not None:
+        where.append("c.is_active = ?")
+        params.append(is_active)
+    return source, " AND ".join(where), params
+
+
+def count_corpus(conn, product_id, feature_id=None, intent_id=None, search=None, is_active=None, limit=None):
+    # 给出 limit 时最多数到 limit + 1 条就停止
+    source, where, params = _corpus_filter(product_id, feature_id, intent_id, search, is_active)
+    if limit is None:
+        return conn.execute(f"""
+            SELECT COUNT(*)
+            {source}
+            WHERE {where}
+        """, params).fetchone()[0]
+    return conn.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT 1
+            {source}
+            WHERE {where}
+            LIMIT ?
+        )
+    """, params + [limit + 1]).fetchone()[0]
+
+
+def corpus_page(conn, product_id, feature_id=None, intent_id=None, search=None, is_active=None,
+                sort="ID", descending=False, page=0, page_size=100):
+    # 返回第 page 页(从 0 开始)的语料,列顺序见 CORPUS_PAGE_COLUMNS,搜索时见 CORPUS_SEARCH_COLUMNS
+    source, where, params = _corpus_filter(product_id, feature_id, intent_id, search, is_active)
+    searching = bool(fts_query(search))
+    order = "DESC" if descending else "ASC"
+    if sort == RELEVANCE_SORT:
+        # rank 越小越相关,正序即相关度从高到低;没有搜索时退回按 ID 排
+        order_by = f"corpus_fts.rank {order}, c.corpus_id {order}" if searching else f"c.corpus_id {order}"
+    elif sort == "ID":
+        # 搜索时按全文索引的 rowid(即 corpus_id)排序,FTS5 可以按顺序直接读出前几条
+        order_by = f"corpus_fts.rowid {order}" if searching else f"c.corpus_id {order}"
+    else:
+        order_by = f"{CORPUS_SORT_COLUMNS[sort]} {order}, c.corpus_id {order}"
+    matched = ", highlight(corpus_fts, 0, '【', '】') as matched" if searching else ""
+    return conn.execute(f"""
+        SELECT f.name as feature_zh, f.name_en as feature_en,
+               i.intent_ch, i.intent_en, c.intent_en as corpus, c.score,
+               c.corpus_id, c.is_active{matched}
+        {source}
+        LEFT JOIN features f ON i.feature_id = f.feature_id
+        WHERE {where}
+        ORDER BY {order_by}
+        LIMIT ? OFFSET ?
+    """, params + [page_size, page * page_size]).fetchall()
+
+
+# 语料 CSV 导入:文件分块写入连接私有的临时暂存表,在 SQL 中解析意图、校验并统计,
+# 预览直接读暂存表,确认后用一条 INSERT ... SELECT 在一个事务中写入 corpus。
+# 暂存表属于会话自己的连接(db.get_connection),页面重跑之间一直存在
+IMPORT_COLUMNS = ['intent_ch', 'intent_en', 'corpus_en', 'score', 'is_active']
+
+
+def create_import_staging(conn):
+    conn.execute("DROP TABLE IF EXISTS temp.corpus_import")
+    conn.execute("""CREATE TEMP TABLE corpus_import
+                    (row_no INTEGER PRIMARY KEY,
+                     intent_ch TEXT,
+                     intent_en TEXT,
+                     corpus_en TEXT,
+                     score REAL,
+                     is_active,
+                     intent_id INTEGER,
+                     error TEXT)""")
+    conn.commit()
+
+
+def has_import_staging(conn):
+    return conn.execute("SELECT 1 FROM temp.sqlite_master WHERE name = 'corpus_import'").fetchone() is not None
+
+
+def drop_import_staging(conn):
+    conn.execute("DROP TABLE IF EXISTS temp.corpus_import")
+    conn.commit()
+
+
+def stage_import_chunk(conn, df):
+    # 写入一块 CSV 数据,缺少的列按空值处理;空值写成 NULL
+    df = df.reindex(columns=IMPORT_COLUMNS).astype(object)
+    df = df.where(df.notna(), None)
+    conn.executemany(f"INSERT INTO temp.corpus_import ({', '.join(IMPORT_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                     df.itertuples(index=False, name=None))
+    conn.commit()
+
+
+def resolve_import_staging(conn, product_id):
+    # 按中文意图名解析意图 ID,同名意图优先取英文意图也相同的,再取 ID 最小的;然后标出错误行
+    c = conn.cursor()
+    c.execute("""
+        UPDATE temp.corpus_import SET intent_id = COALESCE(
+            (SELECT MIN(i.intent_id) FROM intents i
+             WHERE i.product_id = ? AND i.intent_ch = corpus_import.intent_ch AND i.intent_en IS corpus_import.intent_en),
+            (SELECT MIN(i.intent_id) FROM intents i
+             WHERE i.product_id = ? AND i.intent_ch = corpus_import.intent_ch))
+    """, (product_id, product_id))
+    c.execute("""
+        UPDATE temp.corpus_import SET
+            corpus_en = trim(corpus_en),
+            is_active = CASE
+                WHEN is_active IS NULL THEN 1
+                -- 列中有空值时 pandas 按浮点数读取,0 暂存为 0.0,按数值判断
+                WHEN typeof(is_active) IN ('integer', 'real') THEN is_active != 0
+                WHEN lower(trim(is_active)) IN ('0', '0.0', 'false', 'no', 'n', '否') THEN 0
+                ELSE 1
+            END,
+            error = CASE
+                WHEN corpus_en IS NULL OR trim(corpus_en) = '' THEN '语料为空'
+                WHEN intent_id IS NULL THEN '意图不存在'
+                WHEN score IS NOT NULL AND (typeof(score) != 'real' OR score < 0 OR score > 1) THEN '分数无效'
+            END
+    """)
+    conn.commit()
+
+
+def import_staging_summary(conn):
+    # 返回 (总行数, 可导入行数, {错误: 行数})
+    total, ok = conn.execute("SELECT COUNT(*), COUNT(*) - COUNT(error) FROM temp.corpus_import").fetchone()
+    errors = dict(conn.execute("""SELECT error, COUNT(*) FROM temp.corpus_import
+                                  WHERE error IS NOT NULL GROUP BY error ORDER BY COUNT(*) DESC""").fetchall())
+    return total, ok, errors
+
+
+def import_staging_preview(conn, errors_only=False, limit=100):
+    where = "WHERE s.error IS NOT NULL" if errors_only else ""
+    return conn.execute(f"""
+        SELECT s.row_no, s.intent_ch, s.intent_en, s.corpus_en, s.score, s.is_active, s.intent_id,
+               COALESCE(s.error, '准备导入')
+        FROM temp.corpus_import s
+        {where}
+        ORDER BY s.row_no
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+
+def commit_import_staging(conn):
+    # 没有错误的行一次性写入 corpus 并删除暂存表,返回写入的行数。
+    # 关联 intents 是为了跳过预览之后被删除的意图
+    c = conn.cursor()
+    try:
+        c.execute("""
+            INSERT INTO corpus (intent_id, slot_id, intent_en, score, is_active)
+            SELECT s.intent_id, NULL, s.corpus_en, s.score, s.is_active
+            FROM temp.corpus_import s
+            JOIN intents i ON i.intent_id = s.intent_id
+            WHERE s.error IS NULL
+            ORDER BY s.row_no
+        """)
+        inserted = c.rowcount
+        c.execute("DROP TABLE temp.corpus_import")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return inserted
+
+
+# 语料表格的批量激活/停用/删除,每个操作是一条 UPDATE/DELETE ... WHERE corpus_id IN (...)。
+# 选中的 ID 不多时直接写成参数;多时先写入连接私有的临时表再 IN (SELECT ...),
+# 不受 SQLite 参数个数上限的限制。也可以不传 ID 而传筛选条件,作用于当前筛选出的全部语料
+INLINE_IDS_LIMIT = 500
+
+
+def _selection(c, corpus_ids=None, corpus_filter=None):
+    # 返回 IN 后面的 SQL 和参数;corpus_filter 为 _corpus_filter 的关键字参数
+    if corpus_filter is not None:
+        source, where, params = _corpus_filter(**corpus_filter)
+        return f"(SELECT c.corpus_id {source} WHERE {where})", params
+    ids = [int(i) for i in corpus_ids]
+    if len(ids) <= INLINE_IDS_LIMIT:
+        return f"({', '.join('?' * len(ids))})", ids
+    c.execute("CREATE TEMP TABLE IF NOT EXISTS corpus_selection (corpus_id INTEGER PRIMARY KEY)")
+    c.execute("DELETE FROM temp.corpus_selection")
+    c.executemany("INSERT OR IGNORE INTO temp.corpus_selection (corpus_id) VALUES (?)", ((i,) for i in ids))
+    return "(SELECT corpus_id FROM temp.corpus_selection)", []
+
+
+def _apply(conn, statement, params, corpus_ids, corpus_filter):
+    # 在一个事务中执行 statement(其中的 {ids} 替换为选中的语料),返回影响的行数
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        ids, id_params = _selection(c, corpus_ids, corpus_filter)
+        c.execute(statement.format(ids=ids), params + id_params)
+        changed = c.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return changed
+
+
+def set_corpus_active(conn, is_active, corpus_ids=None, corpus_filter=None):
+    # 只修改状态不同的行,返回实际修改的行数
+    return _apply(conn, "UPDATE corpus SET is_active = ? WHERE is_active IS NOT ? AND corpus_id IN {ids}",
+                  [int(is_active), int(is_active)], corpus_ids, corpus_filter)
+
+
+def delete_corpus(conn, corpus_ids=None, corpus_filter=None):
+    # 全文索引由删除触发器同步
+    return _apply(conn, "DELETE FROM corpus WHERE corpus_id IN {ids}", [], corpus_ids, corpus_filter)
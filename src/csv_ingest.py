@@ -0,0 +1,92 @@
+# 各页面 CSV 上传共用的读取流程:从文件开头取样检测编码(Excel 导出的中文 CSV 常是 GBK),
+# 按块读取,每块交给页面的写入函数处理完再读下一块,内存占用只和块大小有关
+
+import codecs
+
+import chardet
+import pandas as pd
+
+# 检测编码时读取的字节数
+SAMPLE_BYTES = 64 * 1024
+
+# 样本之后出现不能按 UTF-8 解码的内容时改用的编码
+FALLBACK_ENCODING = "gb18030"
+
+# 每块的行数
+CHUNK_ROWS = 50000
+
+# 上传后预览的行数
+PREVIEW_ROWS = 100
+
+
+def detect_encoding(f, sample_bytes=SAMPLE_BYTES):
+    # f 为二进制文件对象(如 st.file_uploader 返回的 UploadedFile),检测后回到文件开头
+    f.seek(0)
+    sample = f.read(sample_bytes)
+    f.seek(0)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # 样本可能截断在多字节字符中间,用增量解码器且不要求结尾完整
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    encoding = (chardet.detect(sample)["encoding"] or "gb18030").lower()
+    # chardet 常把 GBK 文件识别为 GB2312,统一按它们的超集 GB18030 读取
+    if encoding in ("gb2312", "gbk", "gb18030"):
+        return "gb18030"
+    return encoding
+
+
+def read_csv_preview(f, rows=PREVIEW_ROWS, dtype=None):
+    # 只读取前几行用于预览和检查表头;dtype 同 pd.read_csv,导入时应传入相同的值
+    df = pd.read_csv(f, encoding=detect_encoding(f), nrows=rows, dtype=dtype)
+    f.seek(0)
+    return df
+
+
+def iter_csv_chunks(f, chunk_rows=CHUNK_ROWS, dtype=None):
+    # 编码只按开头的样本检测,开头全是 ASCII 的 GBK 文件会被当成 UTF-8,读到后面才出错。
+    # 这时从头按 GB18030(能解码任意字节)重新读取,跳过已经返回过的行,调用方不会重复写入
+    encoding = detect_encoding(f)
+    done = 0
+    try:
+        with pd.read_csv(f, encoding=encoding, chunksize=chunk_rows, dtype=dtype) as reader:
+            for chunk in reader:
+                yield chunk
+                done += len(chunk)
+        return
+    except UnicodeDecodeError:
+        if encoding != "utf-8":
+            raise
+    f.seek(0)
+    with pd.read_csv(f, encoding=FALLBACK_ENCODING, chunksize=chunk_rows, dtype=dtype) as reader:
+        for chunk in reader:
+            if done >= len(chunk):
+                done -= len(chunk)
+                continue
+            yield chunk.iloc[done:]
+            done = 0
+
+
+def _size(f):
+    position = f.tell()
+    size = f.seek(0, 2)
+    f.seek(position)
+    return size
+
+
+def ingest_csv(f, write_chunk, on_progress=None, chunk_rows=CHUNK_ROWS, dtype=None):
+    # 逐块读取并调用 write_chunk(df) 写入,上一块写完才读下一块;返回总行数。
+    # 每块单独提交,中途出错时已写入的块会保留。
+    # on_progress: 每块写完调用一次,参数为 (已处理行数, 已读取字节比例)
+    # dtype: 传给 pd.read_csv,例如名称列按字符串读取,避免 "2" 被读成 2.0
+    size = _size(f) or 1
+    rows = 0
+    for chunk in iter_csv_chunks(f, chunk_rows, dtype):
+        write_chunk(chunk)
+        rows += len(chunk)
+        if on_progress is not None:
+            on_progress(rows, min(f.tell() / size, 1.0))
+    return rows
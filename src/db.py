@@ -0,0 +1,71 @@
+import sqlite3
+import threading
+
+import streamlit as st
+
+from migrations import migrate
+
+# 数据库文件路径,相对于启动目录
+DB_PATH = 'cms_data_test.db'
+
+# 遇到写锁时最多等待的时间(毫秒),超过才报 database is locked
+BUSY_TIMEOUT_MS = 5000
+
+
+class Connection(sqlite3.Connection):
+    # 记录打开时的数据库路径,供按数据库文件区分的进程级缓存(catalog)使用
+    def __init__(self, path, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        self.db_path = path
+
+
+def connect(path=DB_PATH):
+    # 新建一个连接并设置:WAL 模式下读写互不阻塞,写入之间通过 busy_timeout 排队
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False, factory=Connection)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def database_path(conn):
+    # 连接对应的数据库文件;db.connect() 建的连接自带路径,其他连接(如直接 sqlite3.connect)查询一次
+    path = getattr(conn, "db_path", None)
+    if path is None:
+        path = conn.execute("PRAGMA database_list").fetchone()[2]
+    return path
+
+
+# 本进程中已确认结构为最新的数据库文件,重跑时不再执行任何 DDL
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def ensure_schema(path=DB_PATH):
+    # 每个进程第一次访问某个数据库文件时执行迁移,之后直接返回
+    if path in _migrated:
+        return
+    with _migrate_lock:
+        if path in _migrated:
+            return
+        conn = connect(path)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        _migrated.add(path)
+
+
+def get_connection(path=DB_PATH):
+    # 每个 Streamlit 会话使用自己的连接,保存在 session_state 中供重跑复用。
+    # 同一会话的脚本不会并发执行,所以允许跨线程使用(check_same_thread=False);
+    # 后台线程需要用 connect() 单独建连接
+    key = f"_db_conn:{path}"
+    conn = st.session_state.get(key)
+    if conn is None:
+        ensure_schema(path)
+        conn = connect(path)
+        st.session_state[key] = conn
+    return conn
+
+
@@ -0,0 +1,162 @@
+import re
+import random
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from operator import eq
+
+from db import database_path
+
+# 基于 MinHash/LSH 的近似重复检测,每个意图维护一个索引,
+# 查询和插入的开销只和短语本身有关,不需要扫描整张 corpus 表
+
+DEFAULT_THRESHOLD = 0.8  # Jaccard 相似度阈值
+NUM_PERM = 64            # MinHash 签名长度
+SHINGLE_SIZE = 3         # 字符 n-gram 长度
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定随机种子,保证不同进程算出的签名一致
+_rng = random.Random(20240901)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize(phrase):
+    return re.sub(r"[^\w{} ]+", "", str(phrase).lower()).strip()
+
+
+def shingles(phrase):
+    text = " ".join(normalize(phrase).split())
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(phrase):
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles(phrase)]
+    return tuple(min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(sig1, sig2):
+    # 签名中相同位置的比例即为 Jaccard 相似度的估计
+    return sum(map(eq, sig1, sig2)) / len(sig1)
+
+
+# 分段方式固定,和阈值无关:16 段 x 4 行,S 曲线拐点 (1/16)^(1/4) = 0.5,
+# 相似度不低于页面上可选的最低阈值 0.5 的短语大概率落入同一个桶成为候选,
+# 候选再按签名算出的相似度和查询时给出的阈值比较。这样每个意图只需要一个索引
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+
+class MinHashLSH:
+    # threshold 为 query 不指定阈值时使用的默认值
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.buckets = [{} for _ in range(BANDS)]
+        self.signatures = {}
+
+    @staticmethod
+    def _band_keys(sig):
+        # 每段用元组的哈希值作为桶的键,比保存元组省内存;哈希冲突只会多出候选,不影响结果
+        return [hash(sig[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS)]
+
+    def add(self, key, phrase, sig=None):
+        sig = sig or minhash(phrase)
+        # 签名值都小于 2^32,用 array 保存比 64 个 int 对象的元组小得多
+        self.signatures[key] = (phrase, array("I", sig))
+        for bucket, band in zip(self.buckets, self._band_keys(sig)):
+            bucket.setdefault(band, []).append(key)
+
+    def query(self, phrase, sig=None, threshold=None):
+        # 返回一条相似度不低于阈值的已有短语,没有则返回 None。
+        # 分段按低阈值划分,同一意图下的候选可能很多,找到第一条就返回
+        sig = sig or minhash(phrase)
+        threshold = self.threshold if threshold is None else threshold
+        seen = set()
+        for bucket, band in zip(self.buckets, self._band_keys(sig)):
+            for key in bucket.get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                other_phrase, other_sig = self.signatures[key]
+                if similarity(sig, other_sig) >= threshold:
+                    return other_phrase
+        return None
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+# 进程内按 (数据库文件, 意图) 缓存索引,记录已加载的最大 corpus_id 和已加载的行数,
+# 之后只增量加载新插入的行。语料被删除时(删除语料、级联删除、清理孤立数据,
+# 可能来自任何连接或进程)行数对不上,整个意图的索引重建。
+# 所有意图的索引合计最多保存 MAX_CACHED_PHRASES 条短语,超出时淘汰最久未使用的意图
+MAX_CACHED_PHRASES = 200000
+
+_indexes = OrderedDict()  # (数据库文件, 意图) -> (索引, 已加载的最大 corpus_id, 已加载的行数)
+_lock = threading.Lock()
+
+
+def _load(c, intent_id, index, last_id, loaded):
+    c.execute("SELECT corpus_id, intent_en FROM corpus WHERE intent_id = ? AND corpus_id > ? ORDER BY corpus_id",
+              (intent_id, last_id))
+    for corpus_id, phrase in c.fetchall():
+        if phrase:
+            index.add(corpus_id, phrase)
+        last_id = corpus_id
+        loaded += 1
+    return last_id, loaded
+
+
+def get_index(conn, intent_id):
+    cache_key = (database_path(conn), intent_id)
+    with _lock:
+        index, last_id, loaded = _indexes.pop(cache_key, (None, 0, 0))
+        c = conn.cursor()
+        if index is not None:
+            last_id, loaded = _load(c, intent_id, index, last_id, loaded)
+            # 只读 idx_corpus_intent 索引计数;和已加载的行数不一致说明有行被删除
+            count = c.execute("SELECT COUNT(*) FROM corpus WHERE intent_id = ? AND corpus_id <= ?",
+                              (intent_id, last_id)).fetchone()[0]
+            if count != loaded:
+                index = None
+        if index is None:
+            index = MinHashLSH()
+            last_id, loaded = _load(c, intent_id, index, 0, 0)
+        _indexes[cache_key] = (index, last_id, loaded)
+        _evict()
+        return index
+
+
+def _evict():
+    # 调用方持有 _lock;刚使用的意图在末尾,不会被淘汰
+    total = sum(len(entry[0]) for entry in _indexes.values())
+    while total > MAX_CACHED_PHRASES and len(_indexes) > 1:
+        _, (index, _, _) = _indexes.popitem(last=False)
+        total -= len(index)
+
+
+def find_duplicates(conn, intent_id, phrases, threshold=DEFAULT_THRESHOLD, batch=None):
+    # 对每个短语返回与之近似重复的已有短语(包括同一批次中更早出现的短语),没有则为 None
+    # batch: 可选的批次索引,分块处理同一批短语时传入同一个对象
+    index = get_index(conn, intent_id)
+    if batch is None:
+        batch = MinHashLSH(threshold)
+    matches = []
+    for i, phrase in enumerate(phrases):
+        sig = minhash(phrase)
+        match = index.query(phrase, sig, threshold) or batch.query(phrase, sig, threshold)
+        matches.append(match)
+        if match is None:
+            batch.add(len(batch), phrase, sig)
+    return matches
+
+
+def filter_duplicates(conn, intent_id, phrases, threshold=DEFAULT_THRESHOLD):
+    # 返回 (保留的下标列表, 被过滤的数量)
+    matches = find_duplicates(conn, intent_id, phrases, threshold)
+    kept = [i for i, match in enumerate(matches) if match is None]
+    return kept, len(phrases) - len(kept)
@@ -3,14 +3,20 @@ import pandas as pd
 from datetime import datetime
 import sqlite3
 import io
+import catalog
+from cascade import delete_features, describe_delete
+from catalog_store import upsert_features, new_upsert_result, describe_upsert, set_active
+from csv_ingest import ingest_csv, read_csv_preview, PREVIEW_ROWS
+
+# 功能列表;check_query_plans.py 检查它的查询计划
+FEATURE_LIST_SQL = "SELECT feature_id, name, name_en, description, created_at, is_active FROM features WHERE product_id = ? ORDER BY created_at DESC"
 
 def manage_features(conn):
     st.header("功能管理")
 
     # 获取所有产品
     c = conn.cursor()
-    c.execute("SELECT product_id, name FROM products")
-    products = c.fetchall()
+    products = catalog.products(conn)
 
     # 创建产品选择下拉框
     product_options = {product[1]: product[0] for product in products}
@@ -35,11 +41,16 @@ def manage_features(conn):
     if add_feature:
         if feature_name and feature_name_en:
             created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            c.execute("INSERT INTO features (product_id, name, name_en, description, created_at, is_active) VALUES (?, ?, ?, ?, ?, ?)",
-                      (product_id, feature_name, feature_name_en, feature_description, created_at, True))
-            conn.commit()
-            st.success("功能添加成功！")
-            st.rerun()
+            try:
+                c.execute("INSERT INTO features (product_id, name, name_en, description, created_at, is_active) VALUES (?, ?, ?, ?, ?, ?)",
+                          (product_id, feature_name, feature_name_en, feature_description, created_at, True))
+                conn.commit()
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                st.error(f"功能 '{feature_name}' 已存在")
+            else:
+                st.success("功能添加成功！")
+                st.rerun()
         else:
             st.error("功能名称（中文和英文）不能为空")
 
@@ -48,8 +59,8 @@ def manage_features(conn):
     uploaded_file = st.file_uploader("上传CSV文件", type="csv")
     
     if uploaded_file is not None:
-        # 读取CSV文件
-        df = pd.read_csv(uploaded_file)
+        # 只读取前几行用于预览和检查表头,导入时再分块读取整个文件
+        df = read_csv_preview(uploaded_file)
         
         # 检查CSV文件的列
         required_columns = ['name', 'name_en', 'description']
@@ -57,25 +68,27 @@ def manage_features(conn):
             st.error("CSV文件格式不正确。请确保文件包含'name'、'name_en'和'description'列。")
         else:
             # 预览数据
-            st.write("数据预览:")
+            st.write(f"数据预览（前 {PREVIEW_ROWS} 行）:")
             st.dataframe(df)
             
             # 确认导入按钮
             if st.button("确认导入"):
-                c = conn.cursor()
-                created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                for _, row in df.iterrows():
-                    c.execute("INSERT INTO features (product_id, name, name_en, description, created_at, is_active) VALUES (?, ?, ?, ?, ?, ?)",
-                              (product_id, row['name'], row['name_en'], row['description'], created_at, True))
-                
-                conn.commit()
-                st.success(f"成功导入 {len(df)} 条功能记录！")
+                # 已存在的同名功能更新英文名称和描述,结果在重跑后显示
+                result = new_upsert_result()
+                progress = st.progress(0.0, text="正在导入...")
+                ingest_csv(uploaded_file, lambda chunk: upsert_features(conn, product_id, chunk, result),
+                           on_progress=lambda rows, ratio: progress.progress(ratio, text=f"已导入 {rows} 行"))
+                st.session_state.feature_import_report = describe_upsert(result)
                 st.rerun()
 
+    if 'feature_import_report' in st.session_state:
+        st.success(f"功能导入完成：{st.session_state.pop('feature_import_report')}")
+
     # 显示功能列表
     st.subheader("功能列表", divider="rainbow")
-    c.execute("SELECT feature_id, name, name_en, description, created_at, is_active FROM features WHERE product_id = ? ORDER BY created_at DESC", (product_id,))
+    if 'feature_delete_report' in st.session_state:
+        st.success(st.session_state.pop('feature_delete_report'))
+    c.execute(FEATURE_LIST_SQL, (product_id,))
     features = c.fetchall()
 
     if features:
@@ -84,31 +97,34 @@ def manage_features(conn):
         df['是否激活'] = df['是否激活'].map({1: '是', 0: '否'})
         st.dataframe(df, use_container_width=True)
 
-        # 删除功能
+        # 删除功能,功能下的意图和语料一起删除
+        feature_names = dict(zip(df['ID'], df['名称（中文）']))
         col1, col2 = st.columns(2)
         with col1:
-            feature_to_delete = st.selectbox("选择要删除的功能", df['名称（中文）'])
+            features_to_delete = st.multiselect("选择要删除的功能", list(feature_names), format_func=feature_names.get,
+                                                help="功能下的意图和语料会一起删除")
         with col2:
-            if st.button("删除选中的功能", type="secondary"):
-                c.execute("DELETE FROM features WHERE product_id = ? AND name = ?", (product_id, feature_to_delete))
-                conn.commit()
-                st.success(f"成功删除功能: {feature_to_delete}")
+            if st.button("删除选中的功能", type="secondary", disabled=not features_to_delete):
+                result = delete_features(conn, product_id, features_to_delete)
+                st.session_state.feature_delete_report = describe_delete(result)
                 st.rerun()
 
-        # 更新功能状态
+        # 批量更新功能状态;放在表单里,勾选时不会重跑页面
         st.subheader("更新功能状态", divider="rainbow")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            feature_to_update = st.selectbox("选择要更新的功能", df['名称（中文）'], key="update_feature")
-        with col2:
-            new_status = st.checkbox("激活状态", value=True)
-        with col3:
-            if st.button("更新功能状态"):
-                c.execute("UPDATE features SET is_active = ? WHERE product_id = ? AND name = ?", 
-                          (new_status, product_id, feature_to_update))
-                conn.commit()
-                st.success(f"成功更新功能状态: {feature_to_update}")
-                st.rerun()
+        if 'feature_status_report' in st.session_state:
+            st.success(st.session_state.pop('feature_status_report'))
+        with st.form("update_feature_status"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                features_to_update = st.multiselect("选择要更新的功能", list(feature_names), format_func=feature_names.get)
+            with col2:
+                new_status = st.radio("状态", ["激活", "停用"], horizontal=True) == "激活"
+            with col3:
+                submitted = st.form_submit_button("更新功能状态")
+        if submitted and features_to_update:
+            changed = set_active(conn, "features", product_id, features_to_update, new_status)
+            st.session_state.feature_status_report = f"已{'激活' if new_status else '停用'} {changed} 个功能"
+            st.rerun()
     else:
         st.info("该产品目前没有添加任何功能。")
 
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import threading
+import time
+
+from db import connect
+
+# igen.generate 的响应缓存,单独存放在一个 SQLite 文件里,避免和业务库抢锁
+CACHE_PATH = 'igen_cache.db'
+DEFAULT_TTL = 7 * 24 * 3600  # 缓存有效期(秒)
+DEFAULT_MAX_ENTRIES = 5000   # 超过后按最近访问时间淘汰
+
+
+def make_key(prompt: str, **params) -> str:
+    # 以完整渲染后的 prompt 加模型参数做内容寻址
+    payload = json.dumps({"prompt": prompt, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                                  (key TEXT PRIMARY KEY,
+                                   value TEXT,
+                                   created_at REAL,
+                                   last_access REAL)''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO responses (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False), now, now))
+            # 先清理过期条目,再按 LRU 淘汰超出容量的部分
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            conn.execute("""DELETE FROM responses WHERE key IN
+                            (SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)""",
+                         (self.max_entries,))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries,
+            }
+
+
+# 进程内共享的缓存实例
+response_cache = ResponseCache()
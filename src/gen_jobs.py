@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+
+from corpus_store import bulk_insert_corpus
+
+# 批量生成任务队列:generation_jobs 记录一次产品批量生成,
+# generation_tasks 按意图拆分,每个意图完成后单独提交,中断后可以从断点继续。
+# 任务状态: pending -> running -> done / failed
+
+# running 状态超过该时长仍未完成,视为进程已崩溃,可以重新领取
+STALE_AFTER = timedelta(minutes=10)
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def create_job(conn, product_id, style, nums, use_cache=True):
+    # use_cache=False 时该任务的所有生成请求都不读取响应缓存
+    c = conn.cursor()
+    c.execute("""INSERT INTO generation_jobs (product_id, style, nums, use_cache, status, created_at, updated_at)
+                 VALUES (?, ?, ?, ?, 'pending', ?, ?)""", (product_id, style, nums, int(use_cache), _now(), _now()))
+    job_id = c.lastrowid
+    # 按 功能 -> 意图 的顺序生成任务
+    c.execute("""INSERT INTO generation_tasks (job_id, intent_id, seq, status)
+                 SELECT ?, i.intent_id, ROW_NUMBER() OVER (ORDER BY f.feature_id, i.intent_id), 'pending'
+                 FROM intents i
+                 JOIN features f ON i.feature_id = f.feature_id
+                 WHERE f.product_id = ? AND i.product_id = ?""", (job_id, product_id, product_id))
+    conn.commit()
+    return job_id
+
+
+def get_job(conn, job_id):
+    c = conn.cursor()
+    c.execute("SELECT job_id, product_id, style, nums, status, use_cache FROM generation_jobs WHERE job_id = ?", (job_id,))
+    return c.fetchone()
+
+
+def recover_stale_tasks(conn, job_id):
+    # 进程崩溃后遗留的 running 任务重新放回队列
+    cutoff = (datetime.now() - STALE_AFTER).strftime("%Y-%m-%d %H:%M:%S")
+    c = conn.cursor()
+    c.execute("""UPDATE generation_tasks SET status = 'pending'
+                 WHERE job_id = ? AND status = 'running' AND started_at < ?""", (job_id, cutoff))
+    conn.commit()
+    return c.rowcount
+
+
+def claim_tasks(conn, job_id, limit):
+    # 原子地领取若干个待处理任务,返回 [(task_id, intent_id, seq), ...]
+    c = conn.cursor()
+    c.execute("""UPDATE generation_tasks
+                 SET status = 'running', attempts = attempts + 1, started_at = ?, error = NULL
+                 WHERE task_id IN (SELECT task_id FROM generation_tasks
+                                   WHERE job_id = ? AND status = 'pending'
+                                   ORDER BY seq LIMIT ?)
+                 RETURNING task_id, intent_id, seq""", (_now(), job_id, limit))
+    claimed = sorted(c.fetchall(), key=lambda t: t[2])
+    c.execute("UPDATE generation_jobs SET status = 'running', updated_at = ? WHERE job_id = ?", (_now(), job_id))
+    conn.commit()
+    return claimed
+
+
+def complete_task(conn, task_id, corpus_rows):
+    # 语料和任务状态在同一个事务中提交,作为该意图的检查点
+    bulk_insert_corpus(conn, ((row[0], row[1], row[2], row[3], 1) for row in corpus_rows), commit=False)
+    c = conn.cursor()
+    c.execute("""UPDATE generation_tasks SET status = 'done', phrase_count = ?, finished_at = ?
+                 WHERE task_id = ?""", (len(corpus_rows), _now(), task_id))
+    conn.commit()
+
+
+def fail_task(conn, task_id, error):
+    c = conn.cursor()
+    c.execute("""UPDATE generation_tasks SET status = 'failed', error = ?, finished_at = ?
+                 WHERE task_id = ?""", (str(error), _now(), task_id))
+    conn.commit()
+
+
+def release_tasks(conn, task_ids):
+    # 执行被中断(例如页面刷新)时,把已领取但未完成的任务放回队列
+    if not task_ids:
+        return
+    c = conn.cursor()
+    c.executemany("UPDATE generation_tasks SET status = 'pending' WHERE task_id = ? AND status = 'running'",
+                  [(task_id,) for task_id in task_ids])
+    conn.commit()
+
+
+def retry_failed(conn, job_id):
+    c = conn.cursor()
+    c.execute("UPDATE generation_tasks SET status = 'pending' WHERE job_id = ? AND status = 'failed'", (job_id,))
+    conn.commit()
+    return c.rowcount
+
+
+def finish_job(conn, job_id):
+    # 根据任务状态更新任务组状态
+    counts = task_counts(conn, job_id)
+    if counts['pending'] or counts['running']:
+        status = 'running'
+    elif counts['failed']:
+        status = 'failed'
+    else:
+        status = 'done'
+    c = conn.cursor()
+    c.execute("UPDATE generation_jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, _now(), job_id))
+    conn.commit()
+    return status
+
+
+def task_counts(conn, job_id):
+    c = conn.cursor()
+    c.execute("SELECT status, COUNT(*) FROM generation_tasks WHERE job_id = ? GROUP BY status", (job_id,))
+    counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+    counts.update(dict(c.fetchall()))
+    return counts
+
+
+def list_jobs(conn, product_id):
+    c = conn.cursor()
+    c.execute("""SELECT j.job_id, j.style, j.nums, j.status, j.created_at, j.updated_at,
+                        SUM(t.status = 'pending'), SUM(t.status = 'running'),
+                        SUM(t.status = 'done'), SUM(t.status = 'failed')
+                 FROM generation_jobs j
+                 LEFT JOIN generation_tasks t ON t.job_id = j.job_id
+                 WHERE j.product_id = ?
+                 GROUP BY j.job_id
+                 ORDER BY j.job_id DESC""", (product_id,))
+    return c.fetchall()
+
+
+def list_tasks(conn, job_id):
+    c = conn.cursor()
+    c.execute("""SELECT t.task_id, f.name, i.intent_ch, t.status, t.attempts, t.phrase_count, t.error
+                 FROM generation_tasks t
+                 JOIN intents i ON t.intent_id = i.intent_id
+                 LEFT JOIN features f ON i.feature_id = f.feature_id
+                 WHERE t.job_id = ?
+                 ORDER BY t.seq""", (job_id,))
+    return c.fetchall()
@@ -0,0 +1,60 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+
+# igen.generate 调用的耗时、token 用量、费用和产出统计,
+# 记录在 generation_metrics 表中,用于调整 n、runs 和并发数
+
+
+def record(conn, source, product_id, intent_id, model, latency_ms, stats, phrases_requested,
+           phrases_kept=None, job_id=None, error=None):
+    # source: 'single' 单条生成 / 'batch' 批量生成
+    phrases_returned = stats.get("phrases", 0)
+    c = conn.cursor()
+    c.execute("""INSERT INTO generation_metrics
+                 (created_at, source, product_id, intent_id, job_id, model, latency_ms,
+                  runs, cached_runs, retries, prompt_tokens, completion_tokens, cost,
+                  phrases_requested, phrases_returned, phrases_kept, error)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+              (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), source, product_id, intent_id, job_id, model,
+               latency_ms, stats.get("runs", 0), stats.get("cached_runs", 0), stats.get("retries", 0),
+               stats.get("prompt_tokens", 0), stats.get("completion_tokens", 0), stats.get("total_cost", 0.0),
+               phrases_requested, phrases_returned,
+               phrases_returned if phrases_kept is None else phrases_kept,
+               None if error is None else str(error)))
+    conn.commit()
+
+
+def summary(conn, days=7):
+    # 按产品汇总最近 days 天的调用:p50/p95 耗时、token、费用、产出率
+    c = conn.cursor()
+    c.execute("""SELECT p.name, m.latency_ms, m.prompt_tokens, m.completion_tokens, m.cost,
+                        m.phrases_requested, m.phrases_kept, m.retries, m.error IS NOT NULL
+                 FROM generation_metrics m
+                 LEFT JOIN products p ON m.product_id = p.product_id
+                 WHERE m.created_at >= datetime('now', 'localtime', ?)""", (f"-{int(days)} days",))
+    df = pd.DataFrame(c.fetchall(), columns=["产品", "latency_ms", "prompt_tokens", "completion_tokens", "cost",
+                                             "requested", "kept", "retries", "failed"])
+    if df.empty:
+        return df
+    grouped = df.groupby("产品")
+    result = pd.DataFrame({
+        "调用数": grouped.size(),
+        "p50(s)": grouped["latency_ms"].quantile(0.5) / 1000,
+        "p95(s)": grouped["latency_ms"].quantile(0.95) / 1000,
+        "tokens": grouped["prompt_tokens"].sum() + grouped["completion_tokens"].sum(),
+        "费用($)": grouped["cost"].sum(),
+        "产出率": grouped["kept"].sum() / grouped["requested"].sum().clip(lower=1),
+        "重试": grouped["retries"].sum(),
+        "失败": grouped["failed"].sum(),
+    })
+    return result.round({"p50(s)": 2, "p95(s)": 2, "费用($)": 4, "产出率": 2})
+
+
+def render_sidebar(conn):
+    with st.sidebar.expander("生成统计(近7天)"):
+        df = summary(conn)
+        if df.empty:
+            st.caption("暂无生成记录")
+        else:
+            st.dataframe(df, use_container_width=True)
@@ -0,0 +1,147 @@
+import os
+import random
+import threading
+import time
+
+# 生成请求调度:按每分钟请求数(RPM)和 token 数(TPM)做令牌桶限流,
+# 失败时按带抖动的指数退避重试,遇到限流自动降速,成功后逐步恢复
+
+
+class TokenBucket:
+    def __init__(self, rate_per_min, burst_seconds=10):
+        self.rate_per_min = rate_per_min
+        self.burst_seconds = burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        return max(1.0, self.rate_per_min * self.burst_seconds / 60)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_min / 60)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        while True:
+            with self._lock:
+                self._refill()
+                # 单次请求超过桶容量时,桶满即可放行,余额记为负数
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                wait = (min(amount, self.capacity) - self.tokens) * 60 / self.rate_per_min
+            time.sleep(min(wait, 1.0))
+
+    def set_rate(self, rate_per_min):
+        with self._lock:
+            self._refill()
+            self.rate_per_min = rate_per_min
+
+
+class RetryBudget:
+    # 每个意图的重试次数上限,同一次 generate 的多轮调用共享
+    def __init__(self, retries):
+        self.remaining = retries
+
+    def consume(self):
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error):
+    if getattr(error, "retryable", False) or is_rate_limited(error):
+        return True
+    if type(error).__name__ in ("APIConnectionError", "APITimeoutError", "InternalServerError"):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and status >= 500
+
+
+def retry_after(error):
+    # 从限流响应头中读取建议的等待时间(秒)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class Scheduler:
+    def __init__(self, rpm=500, tpm=200000, max_retries=5, base_delay=1.0, max_delay=60.0, min_factor=0.1):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_factor = min_factor
+        self.factor = 1.0  # 当前速率相对于配置速率的比例
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+
+    def _set_factor(self, factor):
+        with self._lock:
+            self.factor = min(1.0, max(self.min_factor, factor))
+            self.requests.set_rate(self.rpm * self.factor)
+            self.tokens.set_rate(self.tpm * self.factor)
+
+    def _on_success(self):
+        # 加性恢复
+        if self.factor < 1.0:
+            self._set_factor(self.factor + 0.05)
+
+    def _on_rate_limited(self):
+        # 乘性降速
+        self._set_factor(self.factor * 0.5)
+
+    def backoff(self, attempt, error=None):
+        delay = retry_after(error) if error is not None else None
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+        return delay
+
+    def call(self, fn, est_tokens=0, budget=None, on_retry=None):
+        # 执行 fn,可重试的错误在 budget 内按退避重试,返回 fn 的结果
+        if budget is None:
+            budget = RetryBudget(self.max_retries)
+        attempt = 0
+        while True:
+            self.requests.acquire(1)
+            if est_tokens:
+                self.tokens.acquire(est_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e) or not budget.consume():
+                    raise
+                if is_rate_limited(e):
+                    self._on_rate_limited()
+                if on_retry is not None:
+                    on_retry(e)
+                time.sleep(self.backoff(attempt, e))
+                attempt += 1
+                continue
+            self._on_success()
+            return result
+
+
+# 进程内共享的调度器,限流额度按 API key 计算,所有会话共用
+default_scheduler = Scheduler(
+    rpm=int(os.getenv("IGEN_RPM", "500")),
+    tpm=int(os.getenv("IGEN_TPM", "200000")),
+    max_retries=int(os.getenv("IGEN_MAX_RETRIES", "5")),
+)
@@ -1,12 +1,19 @@
+import ast
 import dotenv
+import hashlib
+import os
+import random
+import threading
+import time
 
-from langchain.prompts import FewShotPromptTemplate, PromptTemplate
+from functools import lru_cache
+
+from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
 from langchain_core.pydantic_v1 import BaseModel
-from langchain_experimental.tabular_synthetic_data.openai import (
-    create_openai_data_generator,
-)
-from langchain_openai import ChatOpenAI
-from typing import List
+from typing import Iterator, List
+
+import gen_scheduler
+from gen_cache import make_key, response_cache
 
 
 class Instruction(BaseModel):
@@ -15,27 +22,9 @@ class Instruction(BaseModel):
 
 dotenv.load_dotenv()
 
-# 参数说明
-# subject: str - 产品名称，例如"扫地机器人"
-# operation: str - 要执行的操作，例如"开始扫地"
-# style: str - 语音风格，例如"常规"、"正式"或"随意"
-# examples: list[str] - 示例短语列表
-# slots: str - 占位符说明，默认为空字符串
-# n: int - 每次运行生成的短语数量，默认为10
-# extra: str - 额外信息或指令，默认为空字符串
-# runs: int - 运行次数，默认为1
-
-def generate(subject: str, operation: str, style: str, examples: list[str], slots: str = '', n=10, extra='',
-             runs=1) -> List[Instruction]:
-    # examples = ["Start cleaning", "begin cleaning"]
-
-    _examples = [
-        {
-            "example": f"""phrases: {examples}"""
-        }
-    ]
+DEFAULT_MODEL = "gpt-4o-mini"
 
-    prompt_prefix = """"A {subject} app has a voice assistant feature that allows users to interact with the voice assistant and have it perform various operations.
+PROMPT_PREFIX = """"A {subject} app has a voice assistant feature that allows users to interact with the voice assistant and have it perform various operations.
     Your task is to help the user generate the most commonly used phrases in spoken American English so they can give instructions to the voice assistant for related operations.
     
     1. The generated phrases should align with how American English is naturally spoken.
@@ -46,7 +35,7 @@ def generate(subject: str, operation: str, style: str, examples: list[str], slot
     
     Examples as below:"""
 
-    prompt_suffix = """The curly braces {{}} in the example are placeholders, and the output should retain this format.
+PROMPT_SUFFIX = """The curly braces {{}} in the example are placeholders, and the output should retain this format.
     
     The meanings of each placeholder are as follows:
     {slots}
@@ -55,37 +44,283 @@ def generate(subject: str, operation: str, style: str, examples: list[str], slot
     
     {extra}"""
 
-    prompt_template = PromptTemplate(input_variables=["example"], template="{example}")
 
-    few_shot_prompt_template = FewShotPromptTemplate(
-        prefix=prompt_prefix,
-        examples=_examples,
-        suffix=prompt_suffix,
-        input_variables=["subject", "operation", "style", "slots", "n", "extra"],
-        example_prompt=prompt_template,
+@lru_cache(maxsize=None)
+def get_prompt() -> FewShotPromptTemplate:
+    # 示例作为普通的输入变量传入,模板本身只需构建一次
+    return FewShotPromptTemplate(
+        prefix=PROMPT_PREFIX,
+        examples=[{"example": "phrases: {examples}"}],
+        suffix=PROMPT_SUFFIX,
+        input_variables=["subject", "operation", "style", "examples", "slots", "n", "extra"],
+        example_prompt=PromptTemplate(input_variables=["example"], template="{example}"),
+        # 显式校验,否则 input_variables 只会从 prefix/suffix 推导,丢掉 examples
+        validate_template=True,
     )
 
+
+@lru_cache(maxsize=8)
+def get_chain(model: str = DEFAULT_MODEL, temperature: float = 1):
+    # OpenAI 相关依赖较重,只在真正使用 OpenAI 后端时导入
+    from langchain_experimental.tabular_synthetic_data.openai import create_openai_data_generator
+    from langchain_openai import ChatOpenAI
+
+    # 按模型参数缓存 ChatOpenAI 和结构化输出链,复用同一个 HTTP 连接池
     synthetic_data_generator = create_openai_data_generator(
         output_schema=Instruction,
-        llm=ChatOpenAI(model="gpt-4o-mini", temperature=1),
-        prompt=few_shot_prompt_template
+        # 重试交给 gen_scheduler 统一处理,避免客户端内部重试和调度器叠加
+        llm=ChatOpenAI(model=model, temperature=temperature, max_retries=0),
+        prompt=get_prompt()
     )
+    # 只复用无状态的 llm_chain;SyntheticDataGenerator 会在 results/examples 上累积状态
+    return synthetic_data_generator.llm_chain
 
-    synthetic_results = synthetic_data_generator.generate(
-        # subject='扫地机器人',
-        # operation='开始扫地',
-        # style='常规',
-        # slots='',
-        # extra='',
-        # n=5,
-        # runs=2,
-        subject=subject,
-        operation=operation,
-        style=style,
-        slots=slots,
-        extra=extra,
-        n=n,
-        runs=runs,
-    )
+
+class BackendError(Exception):
+    # 后端调用失败(网络错误、限流等),可以重试
+    retryable = True
+
+
+# 生成后端接口:run(variables) 返回 (Instruction, 用量 dict),
+# 用量包含 prompt_tokens / completion_tokens / total_cost
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, model: str = DEFAULT_MODEL, temperature: float = 1):
+        self.model = model
+        self.temperature = temperature
+
+    @property
+    def model_name(self):
+        return self.model
+
+    def cache_params(self) -> dict:
+        return {"model": self.model, "temperature": self.temperature}
+
+    def run(self, variables: dict):
+        from langchain_community.callbacks import get_openai_callback
+
+        chain = get_chain(self.model, self.temperature)
+        with get_openai_callback() as cb:
+            result = chain.run(**variables)
+        return result, {
+            "prompt_tokens": cb.prompt_tokens,
+            "completion_tokens": cb.completion_tokens,
+            "total_cost": cb.total_cost,
+        }
+
+
+# 离线后端:不访问网络,按模板确定性地生成短语,用于基准测试和无网络环境。
+# latency 为每次调用的人工延迟(秒),failure_rate 为注入失败的概率
+class OfflineBackend:
+    name = "offline"
+    model_name = "offline"
+
+    PREFIXES = ["", "please ", "can you ", "hey, ", "I want to ", "could you ", "go ahead and ", "let's "]
+    SUFFIXES = ["", " now", " please", " for me", " right away", " again", " real quick"]
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def cache_params(self) -> dict:
+        return {"backend": self.name, "seed": self.seed}
+
+    def _rng(self, variables: dict) -> random.Random:
+        # 用输入内容做种子,相同输入得到相同输出
+        digest = hashlib.sha256(repr(sorted(variables.items())).encode("utf-8")).hexdigest()
+        return random.Random(f"{self.seed}:{digest}")
+
+    def run(self, variables: dict):
+        with self._lock:
+            self._calls += 1
+            call_no = self._calls
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.Random(f"{self.seed}:fail:{call_no}").random() < self.failure_rate:
+            raise BackendError(f"offline backend injected failure (call {call_no})")
+
+        rng = self._rng(variables)
+        operation = str(variables["operation"]).strip().rstrip(".")
+        bases = [operation] + [str(e).strip().rstrip(".") for e in eval_examples(variables.get("examples"))]
+        phrases = []
+        for _ in range(int(variables["n"])):
+            base = rng.choice(bases)
+            phrases.append(f"{rng.choice(self.PREFIXES)}{base}{rng.choice(self.SUFFIXES)}".strip().capitalize())
+        prompt_tokens = len(get_prompt().format(**variables)) // 4
+        return Instruction(phrases=phrases), {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": sum(len(p) for p in phrases) // 4,
+            "total_cost": 0.0,
+        }
+
+
+def eval_examples(examples) -> list:
+    # variables 中的 examples 是 str(list),还原成列表
+    if isinstance(examples, (list, tuple)):
+        return list(examples)
+    try:
+        value = ast.literal_eval(examples or "[]")
+        return list(value) if isinstance(value, (list, tuple)) else []
+    except (ValueError, SyntaxError):
+        return []
+
+
+_backend = None
+
+
+def set_backend(backend):
+    # 替换默认后端,传 None 恢复按环境变量选择
+    global _backend
+    _backend = backend
+
+
+def get_backend(model: str = DEFAULT_MODEL):
+    # 默认后端由环境变量 IGEN_BACKEND 决定: openai(默认) / offline
+    global _backend
+    if _backend is not None:
+        return _backend
+    if os.getenv("IGEN_BACKEND", "openai") == "offline":
+        _backend = OfflineBackend(
+            latency=float(os.getenv("IGEN_OFFLINE_LATENCY", "0")),
+            failure_rate=float(os.getenv("IGEN_OFFLINE_FAILURE_RATE", "0")),
+        )
+        return _backend
+    return _openai_backend(model)
+
+
+@lru_cache(maxsize=8)
+def _openai_backend(model: str):
+    return OpenAIBackend(model)
+
+
+def _retry_budget(retries):
+    if retries is None:
+        retries = gen_scheduler.default_scheduler.max_retries
+    return gen_scheduler.RetryBudget(retries)
+
+
+def new_stats() -> dict:
+    # 一次 generate 调用的用量统计,由调用方传入并在每轮结束后累加
+    return {
+        "runs": 0,
+        "cached_runs": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_cost": 0.0,
+        "phrases": 0,
+    }
+
+
+def _run_once(backend, variables: dict, use_cache: bool, stats: dict = None, budget=None) -> Instruction:
+    if stats is None:
+        stats = new_stats()
+    stats["runs"] += 1
+    prompt = get_prompt().format(**variables)
+    key = make_key(prompt, **backend.cache_params())
+    cached = response_cache.get(key) if use_cache else None
+    if cached is not None:
+        stats["cached_runs"] += 1
+        stats["phrases"] += len(cached)
+        return Instruction(phrases=cached)
+
+    def on_retry(error):
+        stats["retries"] += 1
+
+    # 经调度器限流和重试;token 数按 prompt 长度和生成条数粗略估计
+    est_tokens = len(prompt) // 4 + int(variables["n"]) * 12
+    result, usage = gen_scheduler.default_scheduler.call(lambda: backend.run(variables), est_tokens, budget, on_retry)
+    stats["prompt_tokens"] += usage["prompt_tokens"]
+    stats["completion_tokens"] += usage["completion_tokens"]
+    stats["total_cost"] += usage["total_cost"]
+    stats["phrases"] += len(result.phrases)
+    response_cache.put(key, result.phrases)
+    return result
+
+
+# 参数说明
+# subject: str - 产品名称，例如"扫地机器人"
+# operation: str - 要执行的操作，例如"开始扫地"
+# style: str - 语音风格，例如"常规"、"正式"或"随意"
+# examples: list[str] - 示例短语列表
+# slots: str - 占位符说明，默认为空字符串
+# n: int - 每次运行生成的短语数量，默认为10
+# extra: str - 额外信息或指令，默认为空字符串
+# runs: int - 运行次数，默认为1
+# model: str - 使用的模型，默认为 gpt-4o-mini
+# use_cache: bool - 是否读取响应缓存,False 时强制重新请求以获得新的结果
+# stats: dict - 可选,用 new_stats() 创建,调用结束后包含 token 用量、费用等统计
+# backend: 可选,生成后端,默认由 get_backend() 决定
+# retry_budget: int - 本次调用所有轮次共享的重试次数上限,默认使用调度器的配置
+
+def generate(subject: str, operation: str, style: str, examples: list[str], slots: str = '', n=10, extra='',
+             runs=1, model: str = DEFAULT_MODEL, use_cache: bool = True, stats: dict = None,
+             backend=None, retry_budget: int = None) -> List[Instruction]:
+    # examples = ["Start cleaning", "begin cleaning"]
+
+    backend = backend or get_backend(model)
+    budget = _retry_budget(retry_budget)
+
+    synthetic_results = []
+    for _ in range(runs):
+        variables = dict(
+            subject=subject,
+            operation=operation,
+            style=style,
+            examples=str(examples),
+            slots=slots,
+            extra=extra,
+            n=n,
+        )
+        result = _run_once(backend, variables, use_cache, stats, budget)
+        synthetic_results.append(result)
+        # 和 SyntheticDataGenerator 一样,用上一轮的结果作为下一轮的示例,减少重复
+        examples = result.phrases
 
     return synthetic_results
+
+
+# 流式生成:把总数 n 拆成几次请求,每完成一次就 yield 一次,调用方可以边生成边展示。
+# 第一次只要 chunk_size 条,尽快出结果;第二次加倍,第三次生成剩下的全部,最多三次请求,
+# 每次都带着调用方给的示例(保留占位符格式),之前生成的短语作为不要重复的内容放在额外说明里。
+# 参数含义同 generate,n 为总条数
+def _stream_sizes(n, chunk_size=5):
+    # 每次请求的条数,例如 n=100 时为 [5, 10, 85]
+    sizes = []
+    for size in (chunk_size, chunk_size * 2, n):
+        size = min(size, n - sum(sizes))
+        if size > 0:
+            sizes.append(size)
+    return sizes
+
+
+def _avoid_repeats(extra, previous):
+    if not previous:
+        return extra
+    return f"{extra}\n\n    Do not repeat any of these phrases: {previous}".lstrip()
+
+
+def generate_stream(subject: str, operation: str, style: str, examples: list[str], slots: str = '', n=10, extra='',
+                    chunk_size=5, model: str = DEFAULT_MODEL, use_cache: bool = True, stats: dict = None,
+                    backend=None, retry_budget: int = None) -> Iterator[Instruction]:
+    backend = backend or get_backend(model)
+    budget = _retry_budget(retry_budget)
+
+    previous = []
+    for size in _stream_sizes(n, chunk_size):
+        variables = dict(
+            subject=subject,
+            operation=operation,
+            style=style,
+            examples=str(examples),
+            slots=slots,
+            extra=_avoid_repeats(extra, previous),
+            n=size,
+        )
+        result = _run_once(backend, variables, use_cache, stats, budget)
+        yield result
+        previous += result.phrases
@@ -3,6 +3,12 @@ import pandas as pd
 from datetime import datetime
 import sqlite3
 import io
+import catalog
+from cascade import delete_intents, describe_delete
+from catalog_store import set_active
+from intent_store import resolve_intents, bulk_insert_intents, NAME_DTYPES
+from csv_ingest import ingest_csv, read_csv_preview, PREVIEW_ROWS
+from collections import Counter
 
 # 在函数开始处定义 CSV 表头
 CSV_HEADERS = [
@@ -13,13 +19,21 @@ CSV_HEADERS = [
     'slot_name',      # 关联的Slot名称（可选）
 ]
 
+# 意图列表,{where} 为附加的筛选条件;check_query_plans.py 检查它的查询计划
+INTENT_LIST_SQL = """SELECT i.intent_id, i.intent_ch, i.intent_en, i.description,
+                     f.name as feature_name, s.name as slot_name, i.created_at, i.is_active
+                     FROM intents i
+                     LEFT JOIN features f ON i.feature_id = f.feature_id
+                     LEFT JOIN slots s ON i.slot_id = s.slot_id
+                     WHERE i.product_id = ? {where}
+                     ORDER BY i.created_at DESC"""
+
 def manage_intents(conn):
     st.header("意图管理")
 
     # 获取所有产品
     c = conn.cursor()
-    c.execute("SELECT product_id, name FROM products")
-    products = c.fetchall()
+    products = catalog.products(conn)
 
     # 创建产品选择下拉框
     product_options = {product[1]: product[0] for product in products}
@@ -29,8 +43,7 @@ def manage_intents(conn):
     product_id = product_options[selected_product]
 
     # 获取当前产品的所有features
-    c.execute("SELECT feature_id, name FROM features WHERE product_id = ?", (product_id,))
-    features = c.fetchall()
+    features = catalog.features(conn, product_id)
     feature_options = {"所有功能": None}
     feature_options.update({feature[1]: feature[0] for feature in features})
 
@@ -39,8 +52,7 @@ def manage_intents(conn):
     selected_feature_id = feature_options[selected_feature]
 
     # 获取当前产品的所有slots
-    c.execute("SELECT slot_id, name FROM slots WHERE product_id = ?", (product_id,))
-    slots = c.fetchall()
+    slots = catalog.slots(conn, product_id)
     slot_options = {slot[1]: slot[0] for slot in slots}
     slot_options['无'] = None
 
@@ -73,22 +85,12 @@ def manage_intents(conn):
 
     # 显示意图列表
     st.subheader("意图列表", divider="rainbow")
+    if 'intent_delete_report' in st.session_state:
+        st.success(st.session_state.pop('intent_delete_report'))
     if selected_feature_id is None:
-        c.execute("""SELECT i.intent_id, i.intent_ch, i.intent_en, i.description, 
-                     f.name as feature_name, s.name as slot_name, i.created_at, i.is_active 
-                     FROM intents i 
-                     LEFT JOIN features f ON i.feature_id = f.feature_id
-                     LEFT JOIN slots s ON i.slot_id = s.slot_id 
-                     WHERE i.product_id = ? 
-                     ORDER BY i.created_at DESC""", (product_id,))
+        c.execute(INTENT_LIST_SQL.format(where=""), (product_id,))
     else:
-        c.execute("""SELECT i.intent_id, i.intent_ch, i.intent_en, i.description, 
-                     f.name as feature_name, s.name as slot_name, i.created_at, i.is_active 
-                     FROM intents i 
-                     LEFT JOIN features f ON i.feature_id = f.feature_id
-                     LEFT JOIN slots s ON i.slot_id = s.slot_id 
-                     WHERE i.product_id = ? AND i.feature_id = ?
-                     ORDER BY i.created_at DESC""", (product_id, selected_feature_id))
+        c.execute(INTENT_LIST_SQL.format(where="AND i.feature_id = ?"), (product_id, selected_feature_id))
     intents = c.fetchall()
 
     if intents:
@@ -97,31 +99,34 @@ def manage_intents(conn):
         df['是否激活'] = df['是否激活'].map({1: '是', 0: '否'})
         st.dataframe(df, use_container_width=True)
 
-        # 删除意图
+        # 删除意图,意图下的语料一起删除;同名意图按 ID 区分
+        intent_names = dict(zip(df['ID'], df['中文意图'] + " (" + df['英文意图'].fillna("") + ")"))
         col1, col2 = st.columns(2)
         with col1:
-            intent_to_delete = st.selectbox("选择要删除的意图", df['中文意图'])
+            intents_to_delete = st.multiselect("选择要删除的意图", list(intent_names), format_func=intent_names.get,
+                                               help="意图下的语料会一起删除")
         with col2:
-            if st.button("删除选中的意图", type="secondary"):
-                c.execute("DELETE FROM intents WHERE product_id = ? AND intent_ch = ?", (product_id, intent_to_delete))
-                conn.commit()
-                st.success(f"成功删除意图: {intent_to_delete}")
+            if st.button("删除选中的意图", type="secondary", disabled=not intents_to_delete):
+                result = delete_intents(conn, product_id, intents_to_delete)
+                st.session_state.intent_delete_report = describe_delete(result)
                 st.rerun()
 
-        # 更新意图状态
+        # 批量更新意图状态
         st.subheader("更新意图状态", divider="rainbow")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            intent_to_update = st.selectbox("选择要更新的意图", df['中文意图'], key="update_intent")
-        with col2:
-            new_status = st.checkbox("激活状态", value=True)
-        with col3:
-            if st.button("更新意图状态"):
-                c.execute("UPDATE intents SET is_active = ? WHERE product_id = ? AND intent_ch = ?", 
-                          (new_status, product_id, intent_to_update))
-                conn.commit()
-                st.success(f"成功更新意图状态: {intent_to_update}")
-                st.rerun()
+        if 'intent_status_report' in st.session_state:
+            st.success(st.session_state.pop('intent_status_report'))
+        with st.form("update_intent_status"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                intents_to_update = st.multiselect("选择要更新的意图", list(intent_names), format_func=intent_names.get)
+            with col2:
+                new_status = st.radio("状态", ["激活", "停用"], horizontal=True) == "激活"
+            with col3:
+                submitted = st.form_submit_button("更新意图状态")
+        if submitted and intents_to_update:
+            changed = set_active(conn, "intents", product_id, intents_to_update, new_status)
+            st.session_state.intent_status_report = f"已{'激活' if new_status else '停用'} {changed} 个意图"
+            st.rerun()
     else:
         st.info("该产品目前没有添加任何意图。")
 
@@ -142,51 +147,45 @@ def manage_intents(conn):
    
    
     if uploaded_file is not None:
-        df = pd.read_csv(uploaded_file)
+        # 只读取前几行用于预览和检查表头,导入时再分块读取整个文件
+        df = read_csv_preview(uploaded_file, dtype=NAME_DTYPES)
         
         # 验证 CSV 格式
         if not all(header in df.columns for header in CSV_HEADERS):
             st.error("CSV 文件格式不正确。请确保包含所有必要的列。")
         else:
-            st.write("预览上传的数据:")
+            st.write(f"预览上传的数据（前 {PREVIEW_ROWS} 行）:")
             st.dataframe(df)
-            print(len(df))
 
             if st.button("确认导入"):
-                c = conn.cursor()
-                for _, row in df.iterrows():
-                    # 获取 feature_id
-                    c.execute("SELECT feature_id FROM features WHERE name = ? AND product_id = ?", 
-                              (row['feature_name'], product_id))
-                    feature_id = c.fetchone()
-                    if feature_id:
-                        feature_id = feature_id[0]
-                    else:
-                        st.warning(f"功能 '{row['feature_name']}' 不存在,跳过该行")
-                        continue
-
-                    # 获取 slot_id
-                    slot_id = None
-                    if pd.notna(row['slot_name']):
-                        c.execute("SELECT slot_id FROM slots WHERE name = ? AND product_id = ?", 
-                                  (row['slot_name'], product_id))
-                        slot_result = c.fetchone()
-                        if slot_result:
-                            slot_id = slot_result[0]
-                        else:
-                            st.warning(f"Slot '{row['slot_name']}' 不存在,该意图将不关联 Slot")
-
-                    # 插入新意图
-                    c.execute("""
-                        INSERT INTO intents (product_id, feature_id, slot_id, intent_ch, intent_en, description, created_at, is_active)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (product_id, feature_id, slot_id, row['intent_ch'], row['intent_en'], 
-                          row['description'], datetime.now(), row.get('is_active', True)))
-
-                conn.commit()
-                st.success("成功导入意图!")
+                # 每块单独解析名称并写入,未解析的名称跨块累计
+                imported = 0
+                missing_features, missing_slots = Counter(), Counter()
+
+                def write_chunk(chunk):
+                    nonlocal imported
+                    rows, chunk_missing_features, chunk_missing_slots = resolve_intents(conn, chunk, product_id)
+                    imported += bulk_insert_intents(conn, rows, product_id)
+                    missing_features.update(chunk_missing_features)
+                    missing_slots.update(chunk_missing_slots)
+
+                progress = st.progress(0.0, text="正在导入...")
+                ingest_csv(uploaded_file, write_chunk, dtype=NAME_DTYPES,
+                           on_progress=lambda rows, ratio: progress.progress(ratio, text=f"已处理 {rows} 行"))
+                # 结果汇总保存到 session_state,重跑后显示
+                report = [("success", f"成功导入 {imported} 个意图!")]
+                if missing_features:
+                    names = "、".join(f"{name}({count} 行)" for name, count in missing_features.items())
+                    report.append(("warning", f"以下功能不存在,跳过 {sum(missing_features.values())} 行: {names}"))
+                if missing_slots:
+                    names = "、".join(f"{name}({count} 行)" for name, count in missing_slots.items())
+                    report.append(("warning", f"以下 Slot 不存在,{sum(missing_slots.values())} 个意图将不关联 Slot: {names}"))
+                st.session_state.intent_import_report = report
                 st.rerun()
 
+    for level, message in st.session_state.pop('intent_import_report', []):
+        getattr(st, level)(message)
+
     # 下载当前意图为 CSV
     st.subheader("下载意图", divider="rainbow")
     col1, col2 = st.columns(2)
@@ -0,0 +1,69 @@
+# 意图 CSV 批量导入:一次读出产品下的 功能名 -> ID、Slot 名 -> ID 映射,
+# 用 pandas merge 整列解析,再一次性批量写入,不再逐行查询
+
+from datetime import datetime
+
+import pandas as pd
+
+INSERT_INTENT_SQL = """
+    INSERT INTO intents (product_id, feature_id, slot_id, intent_ch, intent_en, description, created_at, is_active)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _name_map(conn, table, id_column, product_id):
+    # 名称 -> ID;同名的取 ID 最小的一个,和原来逐行 fetchone 按索引顺序取到的一致
+    df = pd.read_sql_query(f"SELECT name, {id_column} FROM {table} WHERE product_id = ? ORDER BY {id_column}",
+                           conn, params=(product_id,))
+    return df.drop_duplicates("name")
+
+
+# 读取意图 CSV 时名称列按字符串读取:数字名称保持原样("2" 不会变成 "2.0")
+NAME_DTYPES = {"feature_name": str, "slot_name": str}
+
+
+def _as_name(column):
+    # 统一成 object 类型的字符串列,空值为 None,才能和数据库中的名称 merge。
+    # 整块都为空的列 pandas 会读成 float64,不转换时 merge 会因类型不一致报错
+    return column.astype(str).astype(object).where(column.notna(), None)
+
+
+def resolve_intents(conn, df, product_id):
+    # 返回 (解析后的 DataFrame, 不存在的功能名 -> 行数, 不存在的 Slot 名 -> 行数)
+    # 功能不存在的行不导入;Slot 不存在的行照常导入,只是不关联 Slot
+    features = _name_map(conn, "features", "feature_id", product_id).rename(columns={"name": "feature_name"})
+    slots = _name_map(conn, "slots", "slot_id", product_id).rename(columns={"name": "slot_name"})
+
+    df = df.reset_index(drop=True)
+    df = df.assign(feature_name=_as_name(df["feature_name"]), slot_name=_as_name(df["slot_name"]))
+    df = df.merge(features, on="feature_name", how="left").merge(slots, on="slot_name", how="left")
+
+    missing_features = df.loc[df["feature_id"].isna(), "feature_name"].fillna("(空)").value_counts().to_dict()
+    missing_slots = df.loc[df["slot_name"].notna() & df["slot_id"].isna(), "slot_name"].value_counts().to_dict()
+    return df[df["feature_id"].notna()], missing_features, missing_slots
+
+
+def bulk_insert_intents(conn, df, product_id):
+    # df 为 resolve_intents 返回的 DataFrame,所有行在一个事务中写入,返回写入的行数
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    is_active = df["is_active"].where(df["is_active"].notna(), True) if "is_active" in df.columns else True
+    rows = pd.DataFrame({
+        "product_id": product_id,
+        "feature_id": df["feature_id"].astype(int),
+        "slot_id": df["slot_id"].astype("Int64"),
+        "intent_ch": df["intent_ch"],
+        "intent_en": df["intent_en"],
+        "description": df["description"],
+        "created_at": created_at,
+        "is_active": is_active,
+    })
+    # 空值写成 NULL,numpy 标量转成 Python 类型
+    rows = rows.astype(object).where(rows.notna(), None)
+    c = conn.cursor()
+    try:
+        c.executemany(INSERT_INTENT_SQL, rows.itertuples(index=False, name=None))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(rows)
@@ -0,0 +1,229 @@
+from datetime import datetime
+
+# 数据库结构迁移:schema_version 表记录已执行的版本,按版本号顺序执行未执行过的步骤。
+# 已发布的步骤不要修改,结构变更一律在 MIGRATIONS 末尾追加新步骤。
+
+
+def _base_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS products
+                 (product_id INTEGER PRIMARY KEY, 
+                  name TEXT, 
+                  description TEXT, 
+                  created_at DATETIME)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS features
+                 (feature_id INTEGER PRIMARY KEY,
+                  product_id INTEGER,
+                  name TEXT,
+                  name_en TEXT,
+                  description TEXT,
+                  created_at DATETIME,
+                  is_active BOOLEAN DEFAULT 1,
+                  FOREIGN KEY(product_id) REFERENCES products(product_id))''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS slots
+                 (slot_id INTEGER PRIMARY KEY,
+                  product_id INTEGER,
+                  name TEXT,
+                  description TEXT,
+                  examples TEXT,
+                  is_active BOOLEAN DEFAULT 1,
+                  FOREIGN KEY(product_id) REFERENCES products(product_id))''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS intents
+                 (intent_id INTEGER PRIMARY KEY,
+                  product_id INTEGER NOT NULL,
+                  feature_id INTEGER NOT NULL,
+                  slot_id INTEGER,
+                  intent_ch TEXT,
+                  intent_en TEXT,
+                  description TEXT,
+                  created_at DATETIME,
+                  is_active BOOLEAN DEFAULT 1,
+                  FOREIGN KEY(product_id) REFERENCES products(product_id),
+                  FOREIGN KEY(feature_id) REFERENCES features(feature_id),
+                  FOREIGN KEY(slot_id) REFERENCES slots(slot_id))''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS corpus
+                 (corpus_id INTEGER PRIMARY KEY,
+                  intent_id INTEGER NOT NULL,
+                  slot_id INTEGER,
+                  intent_en TEXT,
+                  score FLOAT,
+                  is_active BOOLEAN DEFAULT 0,
+                  FOREIGN KEY(intent_id) REFERENCES intents(intent_id),
+                  FOREIGN KEY(slot_id) REFERENCES slots(slot_id))''')
+
+
+def _features_name_en(c):
+    # 早期的数据库(如 cms_data_test.db.bak)没有 features.name_en
+    columns = [row[1] for row in c.execute("PRAGMA table_info(features)")]
+    if 'name_en' not in columns:
+        c.execute("ALTER TABLE features ADD COLUMN name_en TEXT")
+
+
+def _generation_jobs(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS generation_jobs
+                 (job_id INTEGER PRIMARY KEY,
+                  product_id INTEGER NOT NULL,
+                  style TEXT,
+                  nums INTEGER,
+                  status TEXT DEFAULT 'pending',
+                  created_at DATETIME,
+                  updated_at DATETIME,
+                  FOREIGN KEY(product_id) REFERENCES products(product_id))''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS generation_tasks
+                 (task_id INTEGER PRIMARY KEY,
+                  job_id INTEGER NOT NULL,
+                  intent_id INTEGER NOT NULL,
+                  seq INTEGER,
+                  status TEXT DEFAULT 'pending',
+                  attempts INTEGER DEFAULT 0,
+                  phrase_count INTEGER DEFAULT 0,
+                  error TEXT,
+                  started_at DATETIME,
+                  finished_at DATETIME,
+                  FOREIGN KEY(job_id) REFERENCES generation_jobs(job_id),
+                  FOREIGN KEY(intent_id) REFERENCES intents(intent_id))''')
+
+
+def _generation_metrics(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS generation_metrics
+                 (metric_id INTEGER PRIMARY KEY,
+                  created_at DATETIME,
+                  source TEXT,
+                  product_id INTEGER,
+                  intent_id INTEGER,
+                  job_id INTEGER,
+                  model TEXT,
+                  latency_ms REAL,
+                  runs INTEGER,
+                  cached_runs INTEGER,
+                  retries INTEGER,
+                  prompt_tokens INTEGER,
+                  completion_tokens INTEGER,
+                  cost REAL,
+                  phrases_requested INTEGER,
+                  phrases_returned INTEGER,
+                  phrases_kept INTEGER,
+                  error TEXT)''')
+
+
+# 针对各页面实际查询设计的索引,修改查询后用 check_query_plans.py 确认没有退化成全表扫描
+INDEXES = [
+    # 功能下拉框、按名称删除/更新/导入时查找 feature_id
+    "CREATE INDEX IF NOT EXISTS idx_features_product_name ON features(product_id, name)",
+    # Slot 下拉框、按名称删除/更新/导入时查找 slot_id
+    "CREATE INDEX IF NOT EXISTS idx_slots_product_name ON slots(product_id, name)",
+    # 按产品/功能列出意图,intent_ch 放进索引使下拉框查询只读索引
+    "CREATE INDEX IF NOT EXISTS idx_intents_product_feature ON intents(product_id, feature_id, intent_ch)",
+    # 按中文意图名删除/更新
+    "CREATE INDEX IF NOT EXISTS idx_intents_product_intent_ch ON intents(product_id, intent_ch)",
+    # 语料页 corpus JOIN intents,以及去重索引按 intent_id + corpus_id 增量加载
+    "CREATE INDEX IF NOT EXISTS idx_corpus_intent ON corpus(intent_id)",
+    # 批量生成任务领取和状态统计
+    "CREATE INDEX IF NOT EXISTS idx_generation_tasks_job_status ON generation_tasks(job_id, status, seq)",
+    "CREATE INDEX IF NOT EXISTS idx_generation_jobs_product ON generation_jobs(product_id)",
+    # 侧边栏按时间范围汇总生成统计
+    "CREATE INDEX IF NOT EXISTS idx_generation_metrics_created_at ON generation_metrics(created_at)",
+]
+
+
+def _indexes(c):
+    for sql in INDEXES:
+        c.execute(sql)
+
+
+def _corpus_fts(c):
+    # 语料短语的全文索引。外部内容表,文本只存在 corpus 中,由触发器保持同步;
+    # prefix 为 2、3 个字符的前缀另建索引,输入框边打边搜时前缀查询也走索引
+    c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS corpus_fts USING fts5
+                 (intent_en, content='corpus', content_rowid='corpus_id', prefix='2 3')""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS corpus_fts_insert AFTER INSERT ON corpus BEGIN
+                     INSERT INTO corpus_fts (rowid, intent_en) VALUES (new.corpus_id, new.intent_en);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS corpus_fts_delete AFTER DELETE ON corpus BEGIN
+                     INSERT INTO corpus_fts (corpus_fts, rowid, intent_en) VALUES ('delete', old.corpus_id, old.intent_en);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS corpus_fts_update AFTER UPDATE OF intent_en ON corpus BEGIN
+                     INSERT INTO corpus_fts (corpus_fts, rowid, intent_en) VALUES ('delete', old.corpus_id, old.intent_en);
+                     INSERT INTO corpus_fts (rowid, intent_en) VALUES (new.corpus_id, new.intent_en);
+                 END""")
+    # 为已有语料建索引
+    c.execute("INSERT INTO corpus_fts (corpus_fts) VALUES ('rebuild')")
+
+
+def _unique_names(c):
+    # 同一产品下功能/Slot 重名时按名称查找、删除、导入都有歧义。已有的重复行保留 ID 最小的一条,
+    # 引用其余重复行的意图(Slot 还有语料)改为引用保留的那条,然后把按名称查找的索引换成唯一索引
+    for table, id_column, referencing in (("features", "feature_id", ("intents",)),
+                                          ("slots", "slot_id", ("intents", "corpus"))):
+        keep = f"""(SELECT MIN(k.{id_column}) FROM {table} k
+                    WHERE k.product_id = {table}.product_id AND k.name = {table}.name)"""
+        for ref in referencing:
+            c.execute(f"""UPDATE {ref} SET {id_column} = (SELECT {keep} FROM {table} WHERE {table}.{id_column} = {ref}.{id_column})
+                          WHERE {id_column} IN (SELECT {id_column} FROM {table} WHERE {id_column} > {keep})""")
+        c.execute(f"DELETE FROM {table} WHERE {id_column} > {keep}")
+        c.execute(f"DROP INDEX IF EXISTS idx_{table}_product_name")
+        c.execute(f"CREATE UNIQUE INDEX idx_{table}_product_name ON {table}(product_id, name)")
+
+
+def _cascade_indexes(c):
+    # 级联删除意图时按 intent_id 删除生成任务(cascade.py)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_generation_tasks_intent ON generation_tasks(intent_id)")
+
+
+def _generation_jobs_use_cache(c):
+    # 批量生成任务是否读取响应缓存,继续执行和重试时沿用创建任务时的选择
+    columns = [row[1] for row in c.execute("PRAGMA table_info(generation_jobs)")]
+    if 'use_cache' not in columns:
+        c.execute("ALTER TABLE generation_jobs ADD COLUMN use_cache BOOLEAN DEFAULT 1")
+
+
+# (版本号, 说明, 迁移函数),版本号必须递增
+MIGRATIONS = [
+    (1, "基础表", _base_tables),
+    (2, "features.name_en", _features_name_en),
+    (3, "批量生成任务表", _generation_jobs),
+    (4, "生成统计表", _generation_metrics),
+    (5, "查询索引", _indexes),
+    (6, "语料全文索引", _corpus_fts),
+    (7, "功能/Slot 名称唯一", _unique_names),
+    (8, "级联删除索引", _cascade_indexes),
+    (9, "generation_jobs.use_cache", _generation_jobs_use_cache),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                     name TEXT,
+                     applied_at DATETIME)""")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn):
+    # 执行所有未执行的迁移,返回本次执行的版本号列表
+    applied = []
+    if current_version(conn) >= LATEST_VERSION:
+        return applied
+    for version, name, step in MIGRATIONS:
+        c = conn.cursor()
+        # 每一步单独一个事务;BEGIN IMMEDIATE 先拿写锁再检查版本,避免多个进程重复执行
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            if c.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            step(c)
+            c.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                      (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -1,14 +1,21 @@
 import streamlit as st
 import pandas as pd
 import io
+import sqlite3
+import catalog
+from cascade import delete_slots, describe_delete
+from catalog_store import upsert_slots, new_upsert_result, describe_upsert, set_active
+from csv_ingest import ingest_csv, read_csv_preview, PREVIEW_ROWS
+
+# Slot 列表;check_query_plans.py 检查它的查询计划
+SLOT_LIST_SQL = "SELECT * FROM slots WHERE product_id = ?"
 
 def manage_slots(conn):
     st.header("Slots 管理")
     
     # 获取所有产品
     c = conn.cursor()
-    c.execute("SELECT product_id, name FROM products")
-    products = c.fetchall()
+    products = catalog.products(conn)
     
     # 创建产品选择下拉列表
     product_options = {product[1]: product[0] for product in products}
@@ -37,12 +44,17 @@ def manage_slots(conn):
     
     if st.button("添加 Slot", type="primary"):
         if new_slot_name:
-            c.execute("""INSERT INTO slots (product_id, name, description, examples, is_active) 
-                         VALUES (?, ?, ?, ?, ?)""",
-                      (product_id, new_slot_name, new_slot_description, new_slot_examples, new_slot_is_active))
-            conn.commit()
-            st.success(f"成功添加 Slot: {new_slot_name}")
-            st.rerun()
+            try:
+                c.execute("""INSERT INTO slots (product_id, name, description, examples, is_active) 
+                             VALUES (?, ?, ?, ?, ?)""",
+                          (product_id, new_slot_name, new_slot_description, new_slot_examples, new_slot_is_active))
+                conn.commit()
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                st.error(f"Slot '{new_slot_name}' 已存在")
+            else:
+                st.success(f"成功添加 Slot: {new_slot_name}")
+                st.rerun()
         else:
             st.error("Slot 名称不能为空")
 
@@ -71,8 +83,8 @@ def manage_slots(conn):
     uploaded_file = st.file_uploader("选择 CSV 文件上传", type="csv")
     
     if uploaded_file is not None:
-        # 读取 CSV 文件
-        df = pd.read_csv(uploaded_file)
+        # 只读取前几行用于预览和检查表头,上传时再分块读取整个文件
+        df = read_csv_preview(uploaded_file)
         
         # 检查必要的列是否存在
         required_columns = ['name', 'description', 'examples']
@@ -80,58 +92,64 @@ def manage_slots(conn):
             st.error("CSV 文件必须包含以下列: name, description, examples")
         else:
             # 预览数据
-            st.write("预览上传的数据:")
+            st.write(f"预览上传的数据（前 {PREVIEW_ROWS} 行）:")
             st.dataframe(df, use_container_width=True)
             
             # 确认上传
             if st.button("确认上传"):
-                c = conn.cursor()
-                for _, row in df.iterrows():
-                    c.execute("""
-                        INSERT INTO slots (product_id, name, description, examples, is_active)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (product_id, row['name'], row['description'], row['examples'], True))
-                conn.commit()
-                st.success(f"成功上传 {len(df)} 个 Slots")
+                # 已存在的同名 Slot 更新描述和示例,结果在重跑后显示
+                result = new_upsert_result()
+                progress = st.progress(0.0, text="正在上传...")
+                ingest_csv(uploaded_file, lambda chunk: upsert_slots(conn, product_id, chunk, result),
+                           on_progress=lambda rows, ratio: progress.progress(ratio, text=f"已上传 {rows} 行"))
+                st.session_state.slot_import_report = describe_upsert(result)
                 st.rerun()
 
+    if 'slot_import_report' in st.session_state:
+        st.success(f"Slots 上传完成：{st.session_state.pop('slot_import_report')}")
+
     # 显示现有的 Slots
     st.subheader("现有 Slots", divider="rainbow")
-    c.execute("SELECT * FROM slots WHERE product_id = ?", (product_id,))
+    if 'slot_delete_report' in st.session_state:
+        st.success(st.session_state.pop('slot_delete_report'))
+    c.execute(SLOT_LIST_SQL, (product_id,))
     slots = c.fetchall()
     
     if slots:
         df_slots = pd.DataFrame(slots, columns=['slot_id', 'product_id', 'name', 'description', 'examples', 'is_active'])
         st.dataframe(df_slots[['name', 'description', 'examples', 'is_active']], use_container_width=True)
         
-        # 删除 Slot
+        # 删除 Slot,引用它的意图保留,只取消关联
+        slot_names = dict(zip(df_slots['slot_id'], df_slots['name']))
         col1, col2 = st.columns(2)
         with col1:
-            slot_to_delete = st.selectbox("选择要删除的 Slot", df_slots['name'])
+            slots_to_delete = st.multiselect("选择要删除的 Slot", list(slot_names), format_func=slot_names.get,
+                                             help="引用这些 Slot 的意图会保留，只取消关联")
         with col2:
-            if st.button("删除选中的 Slot", type="secondary"):
-                c.execute("DELETE FROM slots WHERE product_id = ? AND name = ?", (product_id, slot_to_delete))
-                conn.commit()
-                st.success(f"成功删除 Slot: {slot_to_delete}")
+            if st.button("删除选中的 Slot", type="secondary", disabled=not slots_to_delete):
+                result = delete_slots(conn, product_id, slots_to_delete)
+                st.session_state.slot_delete_report = describe_delete(result)
                 st.rerun()
     else:
         st.info("当前产品还没有添加任何 Slots")
 
-    # 更新 Slot 状态
+    # 批量更新 Slot 状态
     if slots:
         st.subheader("更新 Slot 状态", divider="rainbow")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            slot_to_update = st.selectbox("选择要更新的 Slot", df_slots['name'], key="update_slot")
-        with col2:
-            new_status = st.checkbox("激活状态", value=True)
-        with col3:
-            if st.button("更新 Slot 状态"):
-                c.execute("UPDATE slots SET is_active = ? WHERE product_id = ? AND name = ?", 
-                          (new_status, product_id, slot_to_update))
-                conn.commit()
-                st.success(f"成功更新 Slot 状态: {slot_to_update}")
-                st.rerun()
+        if 'slot_status_report' in st.session_state:
+            st.success(st.session_state.pop('slot_status_report'))
+        with st.form("update_slot_status"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                slots_to_update = st.multiselect("选择要更新的 Slot", list(slot_names), format_func=slot_names.get)
+            with col2:
+                new_status = st.radio("状态", ["激活", "停用"], horizontal=True) == "激活"
+            with col3:
+                submitted = st.form_submit_button("更新 Slot 状态")
+        if submitted and slots_to_update:
+            changed = set_active(conn, "slots", product_id, slots_to_update, new_status)
+            st.session_state.slot_status_report = f"已{'激活' if new_status else '停用'} {changed} 个 Slot"
+            st.rerun()
 
     # 下载当前 Slots 为 CSV
     st.subheader("下载当前 Slots", divider="rainbow")